@@ -0,0 +1,143 @@
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from ..metrics import REGISTRY
+from .standins import serve_all
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+STAGES = ("embed", "dense", "lexical", "rerank", "jina.embeddings", "jina.rerank", "qdrant.query_batch", "elastic.msearch")
+
+
+def start_standins(config: dict) -> tuple[multiprocessing.Process, dict]:
+    """Run the stand-ins in a child process and point the clients at them through the env."""
+    ready = multiprocessing.Queue()
+    process = multiprocessing.Process(target=serve_all, args=(config, ready), daemon=True)
+    process.start()
+    ports = ready.get(timeout=30)
+    os.environ["JINA_ENDPOINT"] = f"http://127.0.0.1:{ports['jina']}/v1/"
+    os.environ["QDRANT_HOST"] = f"http://127.0.0.1:{ports['qdrant']}"
+    os.environ["ES_HOST"] = f"http://127.0.0.1:{ports['elastic']}"
+    return process, ports
+
+
+def stage_quantiles() -> dict[str, dict[str, float]]:
+    stages = {}
+    for (name, labels), hist in REGISTRY.histograms.items():
+        stage = dict(labels).get("stage")
+        if name == "search_stage_seconds" and stage in STAGES and hist.count:
+            stages[stage] = {f"p{q}_ms": hist.quantile(q / 100) * 1000 for q in (50, 95, 99)}
+    return stages
+
+
+def peak_rss_mb() -> float | None:
+    """Peak resident memory of this process over its whole lifetime, not per level."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 1024  # bytes on macOS, KiB on Linux
+
+
+def run_level(searcher, questions: list[str], concurrency: int, batch_size: int) -> dict:
+    """Drive `searcher.search_batch` from `concurrency` threads over all questions."""
+    batches = [questions[i:i + batch_size] for i in range(0, len(questions), batch_size)]
+
+    def call(batch: list[str]) -> float:
+        start = time.perf_counter()
+        searcher.search_batch(batch)
+        return (time.perf_counter() - start) * 1000
+
+    REGISTRY.reset()
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(call, batches))
+    wall = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+    return {
+        "concurrency": concurrency,
+        "batch_size": batch_size,
+        "queries": len(questions),
+        "qps": len(questions) / wall,
+        "batch_p50_ms": float(np.percentile(latencies, 50)),
+        "batch_p95_ms": float(np.percentile(latencies, 95)),
+        "batch_p99_ms": float(np.percentile(latencies, 99)),
+        "cpu_ms_per_query": cpu * 1000 / len(questions),
+        "stages": stage_quantiles(),
+    }
+
+
+def _ints(value: str) -> list[int]:
+    return [int(v) for v in value.split(",")]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput/latency benchmark of HybridSearcher against local stand-ins")
+    parser.add_argument("--queries", type=int, default=512)
+    parser.add_argument("--concurrency", type=_ints, default=[1, 4, 16])
+    parser.add_argument("--batch-sizes", type=_ints, default=[1, 8, 32])
+    parser.add_argument("--embed-ms", type=float, default=20.0)
+    parser.add_argument("--rerank-ms", type=float, default=40.0)
+    parser.add_argument("--qdrant-ms", type=float, default=5.0)
+    parser.add_argument("--elastic-ms", type=float, default=10.0)
+    parser.add_argument("--per-item-ms", type=float, default=0.5, help="extra service time per text, vector or search")
+    parser.add_argument("--jitter-ms", type=float, default=2.0, help="mean of the exponential latency tail")
+    parser.add_argument("--text-bytes", type=int, default=2000, help="article size returned by Qdrant/ES")
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--rerank-workers", type=int, default=16)
+    parser.add_argument("--output", help="write the report as JSON")
+    args = parser.parse_args()
+
+    def latency(base_ms: float) -> dict:
+        return {"base_ms": base_ms, "per_item_ms": args.per_item_ms, "jitter_ms": args.jitter_ms}
+
+    process, ports = start_standins({
+        "embed": latency(args.embed_ms),
+        "rerank": latency(args.rerank_ms),
+        "qdrant": latency(args.qdrant_ms),
+        "elastic": latency(args.elastic_ms),
+        "dim": args.dim,
+        "text_bytes": args.text_bytes,
+    })
+    print(f"Stand-ins on ports {ports}")
+
+    # Imported after the env points at the stand-ins
+    from ..searcher import HybridSearcher
+
+    searcher = HybridSearcher(rerank_workers=args.rerank_workers)
+    questions = [f"benchmark question {i}" for i in range(args.queries)]
+    searcher.search_batch(questions[:8])  # warm up connections
+
+    report = []
+    for concurrency in args.concurrency:
+        for batch_size in args.batch_sizes:
+            row = run_level(searcher, questions, concurrency, batch_size)
+            report.append(row)
+            stages = " ".join(
+                f"{stage} {q['p50_ms']:.1f}/{q['p95_ms']:.1f}/{q['p99_ms']:.1f}"
+                for stage, q in row["stages"].items() if stage in ("embed", "dense", "lexical", "rerank")
+            )
+            print(
+                f"c={concurrency:<3} b={batch_size:<3} | {row['qps']:8.1f} qps | "
+                f"batch p50/p95/p99 {row['batch_p50_ms']:.1f}/{row['batch_p95_ms']:.1f}/{row['batch_p99_ms']:.1f} ms | "
+                f"cpu {row['cpu_ms_per_query']:.2f} ms/q | {stages}"
+            )
+    peak = peak_rss_mb()
+    print(f"Peak RSS over the whole run: {peak:.0f} MB" if peak is not None else "Peak RSS: not available on this platform")
+    searcher.close()
+    process.terminate()
+
+    if args.output:
+        Path(args.output).write_text(json.dumps({"peak_rss_mb": peak, "levels": report}, indent=2), encoding="utf-8")
+        print(f"\nReport saved to: {args.output}")
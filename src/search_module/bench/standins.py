@@ -0,0 +1,181 @@
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+QDRANT_VERSION = {"title": "qdrant - vector search engine", "version": "1.14.1", "commit": "standin"}
+ES_INFO = {
+    "name": "standin",
+    "cluster_name": "standin",
+    "version": {"number": "8.7.0", "build_flavor": "default"},
+    "tagline": "You Know, for Search",
+}
+
+
+class Latency:
+    """Injected service time: `base_ms + per_item_ms * items`, plus an
+    exponentially distributed tail with mean `jitter_ms`."""
+
+    def __init__(self, base_ms: float = 0.0, per_item_ms: float = 0.0, jitter_ms: float = 0.0) -> None:
+        self.base_ms = base_ms
+        self.per_item_ms = per_item_ms
+        self.jitter_ms = jitter_ms
+
+    def sleep(self, items: int = 1) -> None:
+        ms = self.base_ms + self.per_item_ms * items
+        if self.jitter_ms:
+            ms += random.expovariate(1 / self.jitter_ms)
+        if ms > 0:
+            time.sleep(ms / 1000)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real services
+    disable_nagle_algorithm = True  # headers and body go out in separate writes
+
+    def _read_body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def _send(self, status: int, body, headers: dict | None = None) -> None:
+        data = body if isinstance(body, bytes) else json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+def _source(aid: int, text: str) -> dict:
+    return {"aid": aid, "law_id": f"{aid % 997}/2024/QH15", "doc_id": aid // 20, "content_Article": text}
+
+
+def jina_handler(embed: Latency, rerank: Latency, dim: int = 1024) -> type[BaseHTTPRequestHandler]:
+    """POST /v1/embeddings and /v1/rerank with the Jina response shapes."""
+    # One pre-serialized vector; every input gets the same embedding
+    vector = json.dumps([round(random.uniform(-0.1, 0.1), 6) for _ in range(dim)])
+
+    class JinaHandler(_Handler):
+        def do_POST(self) -> None:
+            data = json.loads(self._read_body())
+            if self.path.endswith("/embeddings"):
+                n = len(data["input"])
+                embed.sleep(n)
+                items = ",".join(f'{{"index":{i},"embedding":{vector}}}' for i in range(n))
+                usage = sum(len(text) // 4 for text in data["input"])
+                self._send(200, f'{{"data":[{items}],"usage":{{"total_tokens":{usage}}}}}'.encode())
+            elif self.path.endswith("/rerank"):
+                n = len(data["documents"])
+                rerank.sleep(n)
+                scores = sorted(((random.random(), i) for i in range(n)), reverse=True)
+                results = [{"index": i, "relevance_score": s} for s, i in scores[:data.get("top_n", n)]]
+                self._send(200, {"results": results, "usage": {"total_tokens": n * 256}})
+            else:
+                self._send(404, {"detail": "not found"})
+
+    return JinaHandler
+
+
+def qdrant_handler(
+    latency: Latency, corpus_size: int = 100_000, text_bytes: int = 2000
+) -> type[BaseHTTPRequestHandler]:
+    """GET / (version check) and POST /collections/{name}/points/query/batch."""
+    text = "x" * text_bytes
+
+    class QdrantHandler(_Handler):
+        def do_GET(self) -> None:
+            self._send(200, QDRANT_VERSION)
+
+        def do_POST(self) -> None:
+            body = json.loads(self._read_body())
+            if not self.path.endswith("/points/query/batch"):
+                self._send(404, {"status": {"error": "not found"}})
+                return
+            searches = body["searches"]
+            latency.sleep(len(searches))
+            results = []
+            for search in searches:
+                with_payload = search.get("with_payload", False)
+                points = []
+                for rank in range(search.get("limit", 10)):
+                    aid = random.randrange(corpus_size)
+                    payload = None
+                    if with_payload:
+                        payload = _source(aid, text)
+                        if isinstance(with_payload, list):
+                            payload = {k: v for k, v in payload.items() if k in with_payload}
+                    points.append({"id": aid, "version": 0, "score": 1.0 - rank * 0.01, "payload": payload})
+                results.append({"points": points})
+            self._send(200, {"result": results, "status": "ok", "time": 0.001})
+
+    return QdrantHandler
+
+
+def elastic_handler(
+    latency: Latency, corpus_size: int = 100_000, text_bytes: int = 2000
+) -> type[BaseHTTPRequestHandler]:
+    """GET / and POST /{index}/_msearch; every response carries the product header
+    the official client checks for."""
+    text = "x" * text_bytes
+    product = {"X-Elastic-Product": "Elasticsearch"}
+
+    class ElasticHandler(_Handler):
+        def do_HEAD(self) -> None:
+            self._send(200, b"", product)
+
+        def do_GET(self) -> None:
+            self._send(200, ES_INFO, product)
+
+        def do_POST(self) -> None:
+            lines = [json.loads(line) for line in self._read_body().splitlines() if line.strip()]
+            if not self.path.split("?")[0].endswith("/_msearch"):
+                self._send(404, {"error": "not found"}, product)
+                return
+            searches = lines[1::2]
+            latency.sleep(len(searches))
+            responses = []
+            for search in searches:
+                fields = search.get("_source")
+                hits = []
+                for rank in range(search.get("size", 10)):
+                    source = _source(random.randrange(corpus_size), text)
+                    if isinstance(fields, list):
+                        source = {k: v for k, v in source.items() if k in fields}
+                    hits.append({"_source": source, "_score": 20.0 - rank})
+                responses.append({"status": 200, "hits": {"hits": hits}})
+            self._send(200, {"responses": responses}, product)
+
+    return ElasticHandler
+
+
+def start(handler: type[BaseHTTPRequestHandler], host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """Serve `handler` on a daemon thread; port 0 picks a free port."""
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def serve_all(config: dict, ready) -> None:
+    """Start the three stand-ins and report their ports on `ready`, then block.
+
+    Meant to run in a child process so its CPU is not billed to the client.
+    """
+    servers = {
+        "jina": start(jina_handler(
+            Latency(**config.get("embed", {})), Latency(**config.get("rerank", {})), config.get("dim", 1024)
+        )),
+        "qdrant": start(qdrant_handler(
+            Latency(**config.get("qdrant", {})), config.get("corpus_size", 100_000), config.get("text_bytes", 2000)
+        )),
+        "elastic": start(elastic_handler(
+            Latency(**config.get("elastic", {})), config.get("corpus_size", 100_000), config.get("text_bytes", 2000)
+        )),
+    }
+    ready.put({name: server.server_address[1] for name, server in servers.items()})
+    threading.Event().wait()
@@ -0,0 +1,123 @@
+import json
+import os
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable
+
+from .searcher import HybridSearcher
+
+
+def shard_of(qid, shards: int) -> int:
+    """Stable shard for a qid, independent of the order questions are listed in."""
+    return zlib.crc32(str(qid).encode("utf-8")) % shards
+
+
+def shard_path(out_dir: str | Path, shard: int) -> Path:
+    return Path(out_dir) / f"shard-{shard:03d}.jsonl"
+
+
+def completed(path: Path) -> set:
+    """Qids already written to a shard file.
+
+    A line cut off by a crash is dropped from the file, so appends resume
+    on a clean line boundary.
+    """
+    if not path.exists():
+        return set()
+    data = path.read_bytes()
+    end = data.rfind(b"\n") + 1
+    if end < len(data):
+        with path.open("r+b") as f:
+            f.truncate(end)
+    return {json.loads(line)["qid"] for line in data[:end].splitlines() if line.strip()}
+
+
+def run_shard(
+    shard: int,
+    queries: list[dict],
+    out_dir: str | Path,
+    searcher_factory: Callable[[], HybridSearcher] = HybridSearcher,
+    batch_size: int = 64,
+) -> int:
+    """Search the not yet completed queries of one shard, appending one JSONL line per qid.
+
+    Runs in a worker process with its own searcher (and so its own client
+    pools). Every batch is flushed and fsynced before the next one starts.
+    Questions whose results were degraded by a failed call (a leg or their
+    rerank) are not written, so a re-run searches them again. Returns the
+    number of queries written.
+    """
+    path = shard_path(out_dir, shard)
+    done = completed(path)
+    todo = [q for q in queries if q["qid"] not in done]
+    if not todo:
+        return 0
+    searcher = searcher_factory()
+    start_time = time.perf_counter()
+    written = 0
+    try:
+        with path.open("a", encoding="utf-8") as f:
+            for start in range(0, len(todo), batch_size):
+                batch = todo[start:start + batch_size]
+                failures = set()
+                results = searcher.search_batch([q["question"] for q in batch], failures=failures)
+                for i, (query_obj, reranked_list) in enumerate(zip(batch, results)):
+                    if i in failures:
+                        continue
+                    record = {"qid": query_obj["qid"], "relevant_laws": [item.get("aid") for item in reranked_list]}
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    written += 1
+                f.flush()
+                os.fsync(f.fileno())
+                done_now = start + len(batch)
+                elapsed = time.perf_counter() - start_time
+                print(
+                    f"[Shard {shard}] {len(done) + written}/{len(queries)} ({done_now / elapsed:.1f} q/s)"
+                    + (f", {done_now - written} degraded, left for a re-run" if written < done_now else "")
+                )
+    finally:
+        searcher.close()
+    return written
+
+
+def run_bulk(
+    queries: list[dict],
+    out_dir: str | Path,
+    shards: int = 4,
+    searcher_factory: Callable[[], HybridSearcher] = HybridSearcher,
+    batch_size: int = 64,
+) -> int:
+    """Search every query across `shards` worker processes; safe to re-run after a crash.
+
+    `searcher_factory` is called once in each worker, so it must be picklable
+    (a module-level function or class). Returns the number of queries
+    written in this run; degraded ones are left for the next run.
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    by_shard: list[list[dict]] = [[] for _ in range(shards)]
+    for query_obj in queries:
+        by_shard[shard_of(query_obj["qid"], shards)].append(query_obj)
+    with ProcessPoolExecutor(max_workers=shards) as pool:
+        futures = [
+            pool.submit(run_shard, shard, shard_queries, out_dir, searcher_factory, batch_size)
+            for shard, shard_queries in enumerate(by_shard)
+        ]
+        return sum(future.result() for future in futures)
+
+
+def merge(out_dir: str | Path, queries: list[dict], output_path: str | Path) -> int:
+    """Write the shard results as one JSON list in question order, the format
+    `evaluate_results` reads. Returns how many questions have no result yet."""
+    results = {}
+    for path in sorted(Path(out_dir).glob("shard-*.jsonl")):
+        with path.open(encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    results[record["qid"]] = record
+    merged = [results[q["qid"]] for q in queries if q["qid"] in results]
+    Path(output_path).write_text(json.dumps(merged, indent=2, ensure_ascii=False), encoding="utf-8")
+    return len(queries) - len(merged)
@@ -0,0 +1,306 @@
+import hashlib
+import json
+import re
+import sqlite3
+import struct
+import threading
+import time
+import unicodedata
+from abc import ABC, abstractmethod
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+
+
+class LRU:
+    """Thread-safe in-memory LRU mapping with a fixed item budget."""
+
+    def __init__(self, max_items: int) -> None:
+        self.max_items = max_items
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_items:
+                self._data.popitem(last=False)
+
+    def discard(self, key, value) -> None:
+        """Drop `key` if it still maps to `value` (not to a newer put)."""
+        with self._lock:
+            if self._data.get(key) is value:
+                del self._data[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+class TieredCache(ABC):
+    """In-memory LRU in front of an optional SQLite table of encoded blobs.
+
+    Subclasses pick the table name and how values are encoded on disk.
+    Without `path` the cache lives in memory only.
+    """
+
+    table = "cache"
+    value_column = "value"
+
+    def __init__(self, path: str | Path | None = None, max_items: int = 100_000) -> None:
+        self.memory = LRU(max_items)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.db = None
+        if path is not None:
+            self.db = sqlite3.connect(str(path), check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self._create_table()
+            self.db.commit()
+
+    def _create_table(self) -> None:
+        self.db.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} (key BLOB PRIMARY KEY, {self.value_column} BLOB NOT NULL)"
+        )
+
+    @abstractmethod
+    def encode(self, value) -> bytes:
+        ...
+
+    @abstractmethod
+    def decode(self, blob: bytes):
+        ...
+
+    def _recall(self, key):
+        """The value held in memory for `key`, or None."""
+        return self.memory.get(key)
+
+    def _select(self, keys: list[bytes]):
+        """(key, row) pairs stored on disk for `keys`; called under `_lock`."""
+        return self.db.execute(
+            f"SELECT key, {self.value_column} FROM {self.table} WHERE key IN ({','.join('?' * len(keys))})",
+            keys,
+        )
+
+    def _restore(self, key, row):
+        """Decode a row from `_select`, keep it in memory and return the value."""
+        value = self.decode(row)
+        self.memory.put(key, value)
+        return value
+
+    def get_many(self, keys: list[bytes]) -> list:
+        found = [self._recall(k) for k in keys]
+        missing = [k for k, v in zip(keys, found) if v is None]
+        if missing and self.db is not None:
+            on_disk = {}
+            with self._lock:
+                # Stay well under SQLite's bound-parameter limit
+                for start in range(0, len(missing), 500):
+                    on_disk.update(self._select(missing[start:start + 500]))
+            for i, k in enumerate(keys):
+                if found[i] is None and k in on_disk:
+                    found[i] = self._restore(k, on_disk[k])
+        hit_count = sum(v is not None for v in found)
+        with self._lock:
+            self.hits += hit_count
+            self.misses += len(keys) - hit_count
+        return found
+
+    def put_many(self, items: list[tuple[bytes, object]]) -> None:
+        for k, v in items:
+            self.memory.put(k, v)
+        if self.db is not None and items:
+            with self._lock:
+                self.db.executemany(
+                    f"INSERT OR REPLACE INTO {self.table} (key, {self.value_column}) VALUES (?, ?)",
+                    [(k, self.encode(v)) for k, v in items],
+                )
+                self.db.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+            "items": len(self.memory),
+        }
+
+    def clear(self) -> None:
+        self.memory.clear()
+        if self.db is not None:
+            with self._lock:
+                self.db.execute(f"DELETE FROM {self.table}")
+                self.db.commit()
+
+    def close(self) -> None:
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+
+class EmbeddingCache(TieredCache):
+    """Content-addressed embedding cache keyed by (model, task, sha256(text)).
+
+    Vectors are stored on disk as raw float32 blobs.
+    """
+
+    table = "embeddings"
+    value_column = "vector"
+
+    @staticmethod
+    def key(model: str, task: str, text: str) -> bytes:
+        digest = hashlib.sha256(text.encode("utf-8")).digest()
+        return f"{model}\0{task}\0".encode("utf-8") + digest
+
+    def encode(self, value: list[float]) -> bytes:
+        return array("f", value).tobytes()
+
+    def decode(self, blob: bytes) -> list[float]:
+        return array("f", blob).tolist()
+
+
+# Old-style tone placement on the second vowel of an open oa / oe / uy syllable ("hoà", "khoẻ", "thuý");
+# "qu" is a consonant, so "quý" keeps its tone where it is
+_OLD_TONE = re.compile(r"(?<!q)(o(?=[ae])|u(?=y))([aey])([\u0300\u0301\u0303\u0309\u0323])(?!\w)")
+
+
+def normalize_query(query: str) -> str:
+    """Unicode NFC, lowercase, collapsed whitespace, and modern Vietnamese tone placement.
+
+    Diacritics are kept: in Vietnamese they change the word ("thuế" / "thuê").
+    """
+    decomposed = unicodedata.normalize("NFD", query.lower())
+    return " ".join(unicodedata.normalize("NFC", _OLD_TONE.sub(r"\1\3\2", decomposed)).split())
+
+
+class RerankCache(TieredCache):
+    """Rerank scores keyed by (model, normalized query, aid, article text).
+
+    The text is part of the key, so an article changed by a sync is scored again.
+    """
+
+    table = "rerank_scores"
+
+    @staticmethod
+    def key(model: str, query: str, aid, text: str) -> bytes:
+        digest = hashlib.sha256(f"{normalize_query(query)}\0{text}".encode("utf-8")).digest()
+        return f"{model}\0{aid}\0".encode("utf-8") + digest
+
+    def encode(self, value: float) -> bytes:
+        return struct.pack("<d", value)
+
+    def decode(self, blob: bytes) -> float:
+        return struct.unpack("<d", blob)[0]
+
+
+class ResultCache(TieredCache):
+    """Whole search results keyed by (corpus version, search config, normalized query).
+
+    Entries expire after `ttl` seconds. In memory at most `max_items` are kept
+    (LRU). With `path`, entries are also written to SQLite, so worker
+    processes on one machine share them; the table is trimmed to
+    `max_disk_items`, dropping expired and then soonest-expiring entries
+    first. Because the corpus version is part of the key, a re-indexed
+    corpus simply stops matching old entries. Every lookup returns fresh
+    copies, so callers may modify the results.
+    """
+
+    table = "results"
+
+    def __init__(
+        self,
+        path: str | Path | None = None,
+        max_items: int = 4096,
+        ttl: float = 3600.0,
+        max_disk_items: int = 1_000_000,
+    ) -> None:
+        self.ttl = ttl
+        self.max_disk_items = max_disk_items
+        self.expired = 0
+        self._puts = 0
+        super().__init__(path, max_items)
+
+    def _create_table(self) -> None:
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS results (key BLOB PRIMARY KEY, expires_at REAL NOT NULL, value BLOB NOT NULL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS results_expires_at ON results (expires_at)")
+
+    @staticmethod
+    def key(query: str, config: str, version: str | None) -> bytes:
+        """`config` is a canonical string of every setting that changes the results."""
+        return hashlib.sha256(f"{version}\0{config}\0{normalize_query(query)}".encode("utf-8")).digest()
+
+    def encode(self, value: list[dict]) -> bytes:
+        return json.dumps(value, ensure_ascii=False).encode("utf-8")
+
+    def decode(self, blob: bytes) -> list[dict]:
+        return json.loads(blob)
+
+    def _recall(self, key) -> list[dict] | None:
+        entry = self.memory.get(key)
+        if entry is None:
+            return None
+        expires_at, results = entry
+        if expires_at <= time.time():
+            self.memory.discard(key, entry)
+            with self._lock:
+                self.expired += 1
+            return None
+        return [dict(item) for item in results]
+
+    def _select(self, keys: list[bytes]):
+        rows = self.db.execute(
+            f"SELECT key, expires_at, value FROM results WHERE expires_at > ? AND key IN ({','.join('?' * len(keys))})",
+            [time.time(), *keys],
+        )
+        return ((k, (expires_at, value)) for k, expires_at, value in rows)
+
+    def _restore(self, key, row) -> list[dict]:
+        expires_at, blob = row
+        results = self.decode(blob)
+        self.memory.put(key, (expires_at, results))
+        return [dict(item) for item in results]
+
+    def put_many(self, items: list[tuple[bytes, list[dict]]]) -> None:
+        expires_at = time.time() + self.ttl
+        for k, v in items:
+            self.memory.put(k, (expires_at, [dict(item) for item in v]))
+        if self.db is not None and items:
+            with self._lock:
+                self.db.executemany(
+                    "INSERT OR REPLACE INTO results (key, expires_at, value) VALUES (?, ?, ?)",
+                    [(k, expires_at, self.encode(v)) for k, v in items],
+                )
+                self._puts += len(items)
+                if self._puts >= 1024:
+                    self._puts = 0
+                    self._trim()
+                self.db.commit()
+
+    def _trim(self) -> None:
+        self.db.execute("DELETE FROM results WHERE expires_at <= ?", (time.time(),))
+        excess = self.db.execute("SELECT COUNT(*) FROM results").fetchone()[0] - self.max_disk_items
+        if excess > 0:
+            self.db.execute(
+                "DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY expires_at LIMIT ?)", (excess,)
+            )
+
+    def stats(self) -> dict:
+        with self._lock:
+            expired = self.expired
+        return super().stats() | {"expired": expired}
@@ -0,0 +1,384 @@
+import json
+import math
+import mmap
+import re
+import unicodedata
+from collections import Counter
+from pathlib import Path
+from typing import Iterable
+
+import numpy as np
+
+from ..hits import scope_mask
+from ..metrics import REGISTRY
+from .elastic import DEFAULT_SEARCH_FIELDS, DEFAULT_SOURCE_FIELDS
+
+K1 = 1.2
+B = 0.75  # my_bm25 in DEFAULT_SETTINGS
+BLOCK = 128  # postings per skip entry
+
+WORD_PATTERN = re.compile(r"\w+")
+# code_tokenizer in DEFAULT_SETTINGS
+CODE_SPLIT_PATTERN = re.compile(r"[ !\"#$%&'()*+,.:;<=>?@\\^_`{|}~]+")
+
+
+def ascii_fold(token: str) -> str:
+    token = token.replace("đ", "d").replace("Đ", "D")
+    return "".join(c for c in unicodedata.normalize("NFD", token) if not unicodedata.combining(c))
+
+
+def _fold_filter(tokens: list[str]) -> list[tuple[str, ...]]:
+    """lowercase + asciifolding(preserve_original): the terms at each position,
+    the original followed by its folded form when that differs."""
+    positions = []
+    for token in tokens:
+        token = token.lower()
+        folded = ascii_fold(token)
+        positions.append((token, folded) if folded != token else (token,))
+    return positions
+
+
+def analyze_text(text: str) -> list[tuple[str, ...]]:
+    """Approximates my_vi_analyzer; syllables stand in for vi_tokenizer's words."""
+    return _fold_filter(WORD_PATTERN.findall(text or ""))
+
+
+def analyze_code(text: str) -> list[tuple[str, ...]]:
+    """code_analyzer: pattern tokenizer, lowercase, asciifolding."""
+    return _fold_filter([t for t in CODE_SPLIT_PATTERN.split(str(text or "")) if t])
+
+
+ANALYZERS = {"content_Article": analyze_text, "law_id": analyze_code}
+
+
+class FieldIndex:
+    """Array-backed postings for one field.
+
+    Term t owns postings[offsets[t]:offsets[t + 1]]: `deltas` holds doc ids
+    as gaps from the previous posting, and `tfs` holds term frequencies.
+    Every BLOCK-th posting has its absolute doc id in `skips`, starting at
+    skip_offsets[t], so any block can be decoded on its own. `max_scores`
+    is each term's BM25 upper bound, which the MaxScore pruning uses.
+
+    Queries are scored per position like ES's SynonymQuery: a token and its
+    folded form count as one term, with their tfs summed and the larger df.
+    """
+
+    ARRAYS = ("offsets", "deltas", "tfs", "skip_offsets", "skips", "doc_lens", "max_scores")
+
+    def __init__(self, vocab: dict[str, int], n_docs: int, avg_len: float, **arrays: np.ndarray) -> None:
+        self.vocab = vocab
+        self.n_docs = n_docs
+        self.avg_len = avg_len
+        for name in self.ARRAYS:
+            setattr(self, name, arrays[name])
+
+    @classmethod
+    def build(cls, analyzed: list[list[tuple[str, ...]]]) -> "FieldIndex":
+        postings: dict[str, list[tuple[int, int]]] = {}
+        doc_lens = np.zeros(len(analyzed), dtype=np.uint32)
+        for doc, positions in enumerate(analyzed):
+            doc_lens[doc] = len(positions)
+            for term, tf in Counter(term for terms in positions for term in terms).items():
+                postings.setdefault(term, []).append((doc, tf))
+        n_docs = len(analyzed)
+        avg_len = float(doc_lens.mean()) if n_docs else 0.0
+
+        vocab = {term: i for i, term in enumerate(sorted(postings))}
+        offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        skip_offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        deltas, tfs, skips = [], [], []
+        max_scores = np.zeros(len(vocab), dtype=np.float32)
+        for term, t in vocab.items():
+            docs = np.fromiter((d for d, _ in postings[term]), dtype=np.int64)
+            freqs = np.fromiter((f for _, f in postings[term]), dtype=np.int64)
+            deltas.append(np.diff(docs, prepend=0).astype(np.uint32))
+            tfs.append(np.minimum(freqs, np.iinfo(np.uint16).max).astype(np.uint16))
+            skips.append(docs[::BLOCK])
+            offsets[t + 1] = offsets[t] + len(docs)
+            skip_offsets[t + 1] = skip_offsets[t] + len(skips[-1])
+            max_scores[t] = _bm25(len(docs), n_docs, freqs, doc_lens[docs], avg_len).max()
+        return cls(
+            vocab, n_docs, avg_len,
+            offsets=offsets,
+            deltas=np.concatenate(deltas) if deltas else np.zeros(0, dtype=np.uint32),
+            tfs=np.concatenate(tfs) if tfs else np.zeros(0, dtype=np.uint16),
+            skip_offsets=skip_offsets,
+            skips=np.concatenate(skips) if skips else np.zeros(0, dtype=np.int64),
+            doc_lens=doc_lens,
+            max_scores=max_scores,
+        )
+
+    def save(self, path: Path) -> None:
+        path.mkdir(parents=True, exist_ok=True)
+        for name in self.ARRAYS:
+            np.save(path / f"{name}.npy", getattr(self, name))
+        (path / "vocab.json").write_text(
+            json.dumps({"n_docs": self.n_docs, "avg_len": self.avg_len, "terms": sorted(self.vocab, key=self.vocab.get)}, ensure_ascii=False),
+            encoding="utf-8",
+        )
+
+    @classmethod
+    def load(cls, path: Path) -> "FieldIndex":
+        header = json.loads((path / "vocab.json").read_text(encoding="utf-8"))
+        # Plain ndarray views of the maps: same zero-copy pages without np.memmap's per-slice overhead
+        arrays = {name: np.load(path / f"{name}.npy", mmap_mode="r").view(np.ndarray) for name in cls.ARRAYS}
+        vocab = {term: i for i, term in enumerate(header["terms"])}
+        return cls(vocab, header["n_docs"], header["avg_len"], **arrays)
+
+    def _block(self, t: int, block: int) -> tuple[np.ndarray, np.ndarray]:
+        start = self.offsets[t] + block * BLOCK
+        end = min(start + BLOCK, self.offsets[t + 1])
+        gaps = self.deltas[start + 1:end].astype(np.int64)
+        docs = self.skips[self.skip_offsets[t] + block] + np.concatenate(([0], np.cumsum(gaps)))
+        return docs, self.tfs[start:end]
+
+    def postings(self, t: int) -> tuple[np.ndarray, np.ndarray]:
+        start, end = self.offsets[t], self.offsets[t + 1]
+        return np.cumsum(self.deltas[start:end], dtype=np.int64), self.tfs[start:end]
+
+    def lookup(self, t: int, docs: np.ndarray) -> np.ndarray:
+        """Term frequencies of t for the sorted `docs`, decoding only the blocks they fall in."""
+        tfs = np.zeros(len(docs), dtype=np.int64)
+        skips = self.skips[self.skip_offsets[t]:self.skip_offsets[t + 1]]
+        blocks = np.searchsorted(skips, docs, side="right") - 1
+        touched_blocks = np.unique(blocks[blocks >= 0])
+        if 4 * len(touched_blocks) >= len(skips):
+            # Most blocks are needed anyway: one cumsum over the whole list is cheaper
+            segments = [(np.ones(len(docs), dtype=bool), *self.postings(t))]
+        else:
+            segments = [(blocks == block, *self._block(t, int(block))) for block in touched_blocks]
+        for mask, seg_docs, seg_tfs in segments:
+            pos = np.minimum(np.searchsorted(seg_docs, docs[mask]), len(seg_docs) - 1)
+            found = seg_docs[pos] == docs[mask]
+            tfs[np.flatnonzero(mask)[found]] = seg_tfs[pos[found]]
+        return tfs
+
+    def _groups(self, positions: list[tuple[str, ...]]) -> Counter:
+        """Query positions as sorted tuples of term ids, counted; unknown terms dropped."""
+        groups = (tuple(sorted({self.vocab[term] for term in terms if term in self.vocab})) for terms in positions)
+        return Counter(group for group in groups if group)
+
+    def group_postings(self, group: tuple[int, ...]) -> tuple[np.ndarray, np.ndarray]:
+        """Union of the group's postings with the tfs summed per doc."""
+        if len(group) == 1:
+            docs, tfs = self.postings(group[0])
+            return docs, tfs.astype(np.int64)
+        docs, tfs = zip(*(self.postings(t) for t in group))
+        docs, inverse = np.unique(np.concatenate(docs), return_inverse=True)
+        return docs, np.bincount(inverse, weights=np.concatenate(tfs)).astype(np.int64)
+
+    def group_lookup(self, group: tuple[int, ...], docs: np.ndarray) -> np.ndarray:
+        return sum(self.lookup(t, docs) for t in group)
+
+    def score(self, group: tuple[int, ...], docs: np.ndarray, tfs: np.ndarray) -> np.ndarray:
+        df = max(int(self.offsets[t + 1] - self.offsets[t]) for t in group)
+        return _bm25(df, self.n_docs, tfs, self.doc_lens[docs], self.avg_len)
+
+    def top_k(self, positions: list[tuple[str, ...]], k: int) -> tuple[np.ndarray, np.ndarray]:
+        """Top-k (docs, scores) for the analyzed query with MaxScore pruning.
+
+        Groups are scored group-at-a-time into a dense accumulator, highest upper
+        bound first. When the upper bounds left can no longer lift an unseen
+        document past the current k-th score, the remaining (usually long,
+        low-idf) lists are only probed for the surviving candidates. A group's
+        bound is the sum of its terms' bounds: the blended idf is no larger
+        than either term's, and BM25's tf saturation is subadditive.
+        """
+        weights = self._groups(positions)
+        if not weights or k <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        bound = {g: float(self.max_scores[list(g)].sum()) * weights[g] for g in weights}
+        order = sorted(weights, key=lambda g: -bound[g])
+        bounds = [bound[g] for g in order]
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        touched = np.zeros(self.n_docs, dtype=bool)
+        for i, g in enumerate(order):
+            remaining = sum(bounds[i:])
+            candidates = np.flatnonzero(touched)
+            if len(candidates) >= k:
+                threshold = np.partition(scores[candidates], -k)[-k]
+                if remaining <= threshold:
+                    # Non-essential from here on: only candidates that can still make the cut
+                    candidates = candidates[scores[candidates] + remaining > threshold]
+                    for g_rest in order[i:]:
+                        tfs = self.group_lookup(g_rest, candidates)
+                        hit = tfs > 0
+                        scores[candidates[hit]] += weights[g_rest] * self.score(g_rest, candidates[hit], tfs[hit])
+                    touched[:] = False
+                    touched[candidates] = True
+                    break
+            docs, tfs = self.group_postings(g)
+            scores[docs] += weights[g] * self.score(g, docs, tfs)
+            touched[docs] = True
+        candidates = np.flatnonzero(touched)
+        k = min(k, len(candidates))
+        top = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return top, scores[top]
+
+    def score_docs(self, positions: list[tuple[str, ...]], docs: np.ndarray) -> np.ndarray:
+        """Exact scores of the query for specific (sorted) docs."""
+        scores = np.zeros(len(docs), dtype=np.float32)
+        for g, weight in self._groups(positions).items():
+            tfs = self.group_lookup(g, docs)
+            hit = tfs > 0
+            scores[hit] += weight * self.score(g, docs[hit], tfs[hit])
+        return scores
+
+
+def _bm25(df: int, n_docs: int, tfs, doc_lens, avg_len: float) -> np.ndarray:
+    """Lucene BM25 as used by Elasticsearch 8."""
+    idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+    tfs = np.asarray(tfs, dtype=np.float32)
+    norm = K1 * (1 - B + B * np.asarray(doc_lens, dtype=np.float32) / max(avg_len, 1e-9))
+    return (idf * tfs / (tfs + norm)).astype(np.float32)
+
+
+class BM25Index:
+    """In-process BM25 over the fields `DEFAULT_MAPPINGS` indexes, saved as
+    memory-mappable arrays plus a JSONL copy of each document's source."""
+
+    def __init__(self, fields: dict[str, FieldIndex], sources: list[dict] | None = None, path: Path | None = None) -> None:
+        self.fields = fields
+        self.path = path
+        self._sources = sources
+        self._source_offsets = None
+        self._source_data = None
+        self._scope_fields = None
+
+    @classmethod
+    def build(cls, docs: Iterable[dict], fields: tuple[str, ...] = DEFAULT_SEARCH_FIELDS) -> "BM25Index":
+        sources = [{k: v for k, v in doc.items() if k != "embedding"} for doc in docs]
+        return cls(
+            {field: FieldIndex.build([ANALYZERS[field](s.get(field, "")) for s in sources]) for field in fields},
+            sources=sources,
+        )
+
+    def save(self, path: str | Path) -> None:
+        """Write the index under `path`. A loaded index streams its sources back
+        from disk, so it cannot be saved over the directory it maps."""
+        path = Path(path)
+        if self.path is not None and path.resolve() == self.path.resolve():
+            raise ValueError(f"cannot save a loaded BM25 index over its own files: {path}")
+        n_docs = next(iter(self.fields.values())).n_docs
+        sources = self._sources if self._sources is not None else (self.source(doc) for doc in range(n_docs))
+        for field, index in self.fields.items():
+            index.save(path / field)
+        offsets = [0]
+        with (path / "sources.jsonl").open("wb") as f:
+            for source in sources:
+                offsets.append(offsets[-1] + f.write((json.dumps(source, ensure_ascii=False) + "\n").encode("utf-8")))
+        np.save(path / "source_offsets.npy", np.asarray(offsets, dtype=np.int64))
+
+    @classmethod
+    def load(cls, path: str | Path) -> "BM25Index":
+        path = Path(path)
+        fields = {p.name: FieldIndex.load(p) for p in sorted(path.iterdir()) if (p / "vocab.json").exists()}
+        return cls(fields, path=path)
+
+    def source(self, doc: int) -> dict:
+        if self._sources is not None:
+            return self._sources[doc]
+        if self._source_offsets is None:
+            with (self.path / "sources.jsonl").open("rb") as f:
+                self._source_data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._source_offsets = np.load(self.path / "source_offsets.npy", mmap_mode="r")
+        return json.loads(self._source_data[self._source_offsets[doc]:self._source_offsets[doc + 1]])
+
+    def scope_docs(self, law_ids=None, doc_ids=None) -> np.ndarray:
+        """Sorted docs inside a scope; the source fields are read once on first use."""
+        if self._scope_fields is None:
+            n_docs = next(iter(self.fields.values())).n_docs
+            sources = [self.source(doc) for doc in range(n_docs)]
+            self._scope_fields = (
+                np.array([source.get("law_id") for source in sources], dtype=object),
+                np.array([source.get("doc_id", -1) for source in sources], dtype=np.int64),
+            )
+        return np.flatnonzero(scope_mask(*self._scope_fields, law_ids, doc_ids))
+
+    def search(
+        self,
+        query: str,
+        size: int = 10,
+        search_fields: tuple[str, ...] = DEFAULT_SEARCH_FIELDS,
+        docs: np.ndarray | None = None,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """multi_match best_fields: a doc scores its best field's BM25.
+
+        With `docs` (sorted), only those documents are scored, like an ES filter.
+        """
+        terms = {field: ANALYZERS[field](query) for field in search_fields}
+        if docs is not None:
+            candidates = docs
+        else:
+            candidates = np.unique(np.concatenate(
+                [self.fields[field].top_k(terms[field], size)[0] for field in search_fields]
+            ))
+        if len(candidates) == 0:
+            return candidates, np.zeros(0, dtype=np.float32)
+        # Any true top-k doc is in its best field's top-k, so rescoring the union is exact
+        scores = np.max([self.fields[field].score_docs(terms[field], candidates) for field in search_fields], axis=0)
+        matched = np.flatnonzero(scores > 0)
+        top = matched[np.argsort(-scores[matched], kind="stable")[:size]]
+        return candidates[top], scores[top]
+
+
+class LocalBM25:
+    """In-process stand-in for `Elastic` on the lexical search path.
+
+    Indexes live under `root/<index_name>` and are memory-mapped on first use.
+    `law_ids` / `doc_ids` score only the documents in scope.
+    """
+
+    def __init__(self, root: str | Path) -> None:
+        self.root = Path(root)
+        self._indexes: dict[str, BM25Index] = {}
+
+    def check_health(self) -> bool:
+        return self.root.exists()
+
+    def init_index(self, index_name: str, docs: Iterable[dict]) -> BM25Index:
+        index = BM25Index.build(docs)
+        index.save(self.root / index_name)
+        self._indexes[index_name] = BM25Index.load(self.root / index_name)
+        return self._indexes[index_name]
+
+    def _index(self, index_name: str) -> BM25Index:
+        if index_name not in self._indexes:
+            self._indexes[index_name] = BM25Index.load(self.root / index_name)
+        return self._indexes[index_name]
+
+    def search_batch(
+        self,
+        index_name: str,
+        queries: list[str],
+        size: int = 10,
+        fields: tuple[str, ...] = DEFAULT_SOURCE_FIELDS,
+        search_fields: tuple[str, ...] = DEFAULT_SEARCH_FIELDS,
+        law_ids=None,
+        doc_ids=None,
+    ) -> list[list[dict]]:
+        """See `Elastic.search_batch`."""
+        index = self._index(index_name)
+        scope = None
+        if law_ids is not None or doc_ids is not None:
+            scope = index.scope_docs(law_ids, doc_ids)
+        results = []
+        for query in queries:
+            with REGISTRY.timer("bm25.search"):
+                docs, scores = index.search(query, size, search_fields, scope)
+            results.append([
+                {k: v for k, v in index.source(int(d)).items() if k in fields} | {"score": float(s)}
+                for d, s in zip(docs, scores)
+            ])
+        return results
+
+
+if __name__ == "__main__":
+    from ..embedding_store import EmbeddingStore
+
+    store = EmbeddingStore(r"d:\Work\VLSP\Dataset\legal_corpus_embedded_combined")
+    bm25 = LocalBM25(r"d:\Work\VLSP\Dataset\bm25")
+    bm25.init_index("legal_corpus", (m for metadata, _ in store.iter_batches() for m in metadata))
+    print(bm25.search_batch("legal_corpus", ["thuế thu nhập cá nhân"], size=5))
@@ -1,7 +1,12 @@
 import os
+import uuid
+from contextlib import contextmanager
+from typing import Iterable, Iterator
 
 from dotenv import load_dotenv
-from elasticsearch import Elasticsearch, helpers
+from elasticsearch import AsyncElasticsearch, Elasticsearch, helpers
+
+from ..metrics import REGISTRY
 
 load_dotenv()
 
@@ -39,21 +44,102 @@ DEFAULT_MAPPINGS = {
             "analyzer": "my_vi_analyzer",
             "similarity": "my_bm25",
         },
-        "law_id": {"type": "text", "analyzer": "code_analyzer"},
-        "doc_id": {"type": "integer", "index": False},
+        # Analyzed for matching, plus an exact keyword sub-field for scope filters
+        "law_id": {
+            "type": "text",
+            "analyzer": "code_analyzer",
+            "fields": {"keyword": {"type": "keyword"}},
+        },
+        "doc_id": {"type": "integer"},
     }
 }
 
+DEFAULT_SOURCE_FIELDS = ("aid", "law_id", "doc_id")
+DEFAULT_SEARCH_FIELDS = ("content_Article", "law_id")
+# `status` is kept so a sub-search with no hits still leaves an entry in `responses`
+MSEARCH_FILTER_PATH = [
+    "responses.status",
+    "responses.hits.hits._source",
+    "responses.hits.hits._score",
+    "responses.error",
+]
+
+
+def _connection_kwargs() -> dict:
+    return {
+        "hosts": os.getenv("ES_HOST", "http://localhost:9200"),
+        "basic_auth": (
+            os.getenv("ES_USER", "elastic"),
+            os.getenv("ES_PASSWORD", "empty"),
+        ),
+    }
+
+
+def _scope_filter(law_ids: Iterable[str] | None, doc_ids: Iterable[int] | None) -> list[dict]:
+    scope = []
+    if law_ids is not None:
+        scope.append({"terms": {"law_id.keyword": list(law_ids)}})
+    if doc_ids is not None:
+        scope.append({"terms": {"doc_id": list(doc_ids)}})
+    return scope
+
+
+def _msearch_body(
+    queries: list[str],
+    size: int,
+    fields: tuple[str, ...],
+    search_fields: tuple[str, ...],
+    law_ids: Iterable[str] | None = None,
+    doc_ids: Iterable[int] | None = None,
+) -> list[dict]:
+    scope = _scope_filter(law_ids, doc_ids)
+    searches = []
+    for query in queries:
+        match = {"multi_match": {"query": query, "fields": list(search_fields)}}
+        searches.append({})
+        searches.append({
+            # Filter context: not scored, and the filter bitset is cached across queries
+            "query": {"bool": {"must": match, "filter": scope}} if scope else match,
+            "size": size,
+            "_source": list(fields),
+        })
+    return searches
+
+
+def _index_actions(index_name: str, datapoints: Iterable[dict]) -> Iterator[dict]:
+    """Bulk index actions keyed by aid, so re-uploading a datapoint overwrites it."""
+    for i in datapoints:
+        source = {k: v for k, v in i.items() if k != "embedding"}
+        action = {"_index": index_name, "_source": source}
+        if source.get("aid") is not None:
+            action["_id"] = source["aid"]
+        yield action
+
+
+def _response_size(response) -> int | None:
+    length = response.meta.headers.get("content-length")
+    return int(length) if length is not None else None
+
+
+def _parse_msearch(body: dict, expected: int) -> list[list[dict]]:
+    """One hit list per query; raises if the responses do not line up with the queries."""
+    responses = body.get("responses", [])
+    if len(responses) != expected:
+        raise ValueError(f"got {len(responses)} msearch responses for {expected} queries")
+    results = []
+    for item in responses:
+        hits = item.get("hits", {}).get("hits", [])
+        results.append([hit.get("_source", {}) | {"score": hit.get("_score")} for hit in hits])
+    return results
+
+
+def _parse_mget(body: dict) -> dict[int, str]:
+    return {int(doc["_id"]): doc["_source"]["content_Article"] for doc in body.get("docs", []) if doc.get("found")}
+
 
 class Elastic:
     def __init__(self) -> None:
-        self.client = Elasticsearch(
-            os.getenv("ES_HOST", "http://localhost:9200"),
-            basic_auth=(
-                os.getenv("ES_USER", "elastic"),
-                os.getenv("ES_PASSWORD", "empty"),
-            ),
-        )
+        self.client = Elasticsearch(**_connection_kwargs())
 
     def check_health(self) -> bool:
         return self.client.ping()
@@ -63,17 +149,180 @@ class Elastic:
             self.client.indices.create(
                 index=index_name, mappings=DEFAULT_MAPPINGS, settings=DEFAULT_SETTINGS
             )
+            self.bump_corpus_version(index_name)
             return True
+        self.ensure_scope_mapping(index_name)
         return False
 
-    def bulk_upload(self, index_name: str, datapoints: list[dict]):
-        bulk_data = []
-        for i in datapoints:
-            if "embedding" in i:
-                bulk_data.append({k: v for k, v in i.items() if k != "embedding"})
+    def ensure_scope_mapping(self, index_name: str) -> bool:
+        """Add the `law_id.keyword` sub-field that scope filters use to an index
+        created before it existed, then re-index in place to fill it.
+
+        The old unindexed `doc_id` is left alone: ES cannot change `index` on an
+        existing field, and doc-values still answer its terms filter, only slower.
+        Returns whether the mapping changed.
+        """
+        mappings = self.client.indices.get_mapping(index=index_name).body
+        law_id = next(iter(mappings.values()))["mappings"].get("properties", {}).get("law_id", {})
+        if "keyword" in law_id.get("fields", {}):
+            return False
+        print(f"[Elastic] adding law_id.keyword to {index_name} and backfilling")
+        self.client.indices.put_mapping(
+            index=index_name, properties={"law_id": DEFAULT_MAPPINGS["properties"]["law_id"]}
+        )
+        self.client.update_by_query(index=index_name, conflicts="proceed", refresh=True, wait_for_completion=True)
+        self.bump_corpus_version(index_name)
+        return True
+
+    def corpus_version(self, index_name: str) -> str | None:
+        """Token in the index `_meta` that `bump_corpus_version` changes."""
+        mappings = self.client.indices.get_mapping(index=index_name).body
+        return next(iter(mappings.values()))["mappings"].get("_meta", {}).get("corpus_version")
+
+    def bump_corpus_version(self, index_name: str) -> str:
+        """Mark the corpus as changed. Call it once a write is searchable in every
+        store (ES refreshed, Qdrant applied); `bulk_upload` and `delete` do so
+        themselves, `ingest` after a `parallel_bulk_upload`."""
+        version = uuid.uuid4().hex
+        self.client.indices.put_mapping(index=index_name, meta={"corpus_version": version})
+        return version
+
+    def bulk_upload(self, index_name: str, datapoints: list[dict], bump: bool = True):
+        """Index documents and refresh. With `bump`, the corpus version changes once
+        they are searchable; write Qdrant first so both stores hold them by then."""
+        result = helpers.bulk(self.client, _index_actions(index_name, datapoints), refresh=True)
+        if bump:
+            self.bump_corpus_version(index_name)
+        return result
+
+    def delete(self, index_name: str, aids: list[int], bump: bool = True):
+        """Delete documents by aid; aids that are not indexed are ignored. `bump`
+        as in `bulk_upload`."""
+        actions = ({"_op_type": "delete", "_index": index_name, "_id": aid} for aid in aids)
+        result = helpers.bulk(self.client, actions, refresh=True, raise_on_error=False)
+        if bump:
+            self.bump_corpus_version(index_name)
+        return result
+
+    def parallel_bulk_upload(
+        self,
+        index_name: str,
+        datapoints: Iterable[dict],
+        thread_count: int = 4,
+        chunk_size: int = 500,
+    ) -> tuple[int, int]:
+        """Stream datapoints through `helpers.parallel_bulk` without refreshing.
+
+        Returns (indexed, failed) counts. Wrap large loads in `bulk_load_mode`.
+        """
+        indexed = failed = 0
+        for ok, item in helpers.parallel_bulk(
+            self.client,
+            _index_actions(index_name, datapoints),
+            thread_count=thread_count,
+            chunk_size=chunk_size,
+            raise_on_error=False,
+        ):
+            if ok:
+                indexed += 1
             else:
-                bulk_data.append(i)
-        return helpers.bulk(self.client, bulk_data, index=index_name, refresh=True)
+                failed += 1
+                print(f"[Elastic Error] Bulk item failed: {item}")
+        return indexed, failed
+
+    @contextmanager
+    def bulk_load_mode(self, index_name: str, zero_replicas: bool = True):
+        """Disable refresh (and optionally replicas) for the duration of a bulk load.
+
+        The previous settings are restored and the index is refreshed on exit.
+        """
+        current = self.client.indices.get_settings(
+            index=index_name, include_defaults=True, flat_settings=True
+        )[index_name]
+        settings = current["defaults"] | current["settings"]
+        restore = {"index.refresh_interval": settings.get("index.refresh_interval", "1s")}
+        load = {"index.refresh_interval": "-1"}
+        if zero_replicas:
+            restore["index.number_of_replicas"] = settings.get("index.number_of_replicas", "1")
+            load["index.number_of_replicas"] = 0
+        self.client.indices.put_settings(index=index_name, settings=load)
+        try:
+            yield
+        finally:
+            self.client.indices.put_settings(index=index_name, settings=restore)
+            self.client.indices.refresh(index=index_name)
+
+    def get_texts(self, index_name: str, aids: list[int]) -> dict[int, str]:
+        """Article text by aid in one `mget`; aids that are not indexed are left out."""
+        response = self.client.mget(index=index_name, ids=[str(aid) for aid in aids], source=["content_Article"])
+        return _parse_mget(response.body)
+
+    def search_batch(
+        self,
+        index_name: str,
+        queries: list[str],
+        size: int = 10,
+        fields: tuple[str, ...] = DEFAULT_SOURCE_FIELDS,
+        search_fields: tuple[str, ...] = DEFAULT_SEARCH_FIELDS,
+        law_ids: Iterable[str] | None = None,
+        doc_ids: Iterable[int] | None = None,
+    ) -> list[list[dict]]:
+        """Run one `_msearch` for all queries; returns `_source` + score hits per query.
+
+        Only `fields` are fetched from `_source`. A `multi_match` query takes the
+        raw text, so no query-string escaping is needed. A query that fails
+        inside the batch yields an empty hit list. `law_ids` / `doc_ids`
+        restrict every query to those laws / documents. This needs an index
+        created with the current `DEFAULT_MAPPINGS`, or one upgraded by
+        `ensure_scope_mapping` (which `init_index` runs on existing indexes).
+        """
+        if not queries:
+            return []
+        with REGISTRY.timer("elastic.msearch") as span:
+            response = self.client.msearch(
+                index=index_name,
+                searches=_msearch_body(queries, size, fields, search_fields, law_ids, doc_ids),
+                filter_path=MSEARCH_FILTER_PATH,
+            )
+            span["received"] = _response_size(response)
+            return _parse_msearch(response.body, len(queries))
+
+
+class AsyncElastic:
+    """asyncio counterpart of `Elastic` for the search path."""
+
+    def __init__(self) -> None:
+        self.client = AsyncElasticsearch(**_connection_kwargs())
+
+    async def close(self) -> None:
+        await self.client.close()
+
+    async def get_texts(self, index_name: str, aids: list[int]) -> dict[int, str]:
+        """See `Elastic.get_texts`."""
+        response = await self.client.mget(index=index_name, ids=[str(aid) for aid in aids], source=["content_Article"])
+        return _parse_mget(response.body)
+
+    async def search_batch(
+        self,
+        index_name: str,
+        queries: list[str],
+        size: int = 10,
+        fields: tuple[str, ...] = DEFAULT_SOURCE_FIELDS,
+        search_fields: tuple[str, ...] = DEFAULT_SEARCH_FIELDS,
+        law_ids: Iterable[str] | None = None,
+        doc_ids: Iterable[int] | None = None,
+    ) -> list[list[dict]]:
+        """See `Elastic.search_batch`."""
+        if not queries:
+            return []
+        with REGISTRY.timer("elastic.msearch") as span:
+            response = await self.client.msearch(
+                index=index_name,
+                searches=_msearch_body(queries, size, fields, search_fields, law_ids, doc_ids),
+                filter_path=MSEARCH_FILTER_PATH,
+            )
+            span["received"] = _response_size(response)
+            return _parse_msearch(response.body, len(queries))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,143 @@
+import json
+import mmap
+from pathlib import Path
+
+import numpy as np
+
+from ..embedding_store import EmbeddingStore
+from ..hits import scope_mask
+from ..metrics import REGISTRY
+
+NORMALIZED_FILE = "normalized.npy"
+ROWS_FILE = "normalized_rows.npy"
+
+
+class LocalVector:
+    """In-process exact cosine search with the `Qdrant.search_batch` surface.
+
+    Each collection is an `EmbeddingStore` directory under `root`. On first
+    use its live rows are L2-normalized once into `normalized.npy` next to
+    the store, with their store row numbers in `normalized_rows.npy`; both
+    are rebuilt when the store's live rows change (e.g. after a sync). That file is memory-mapped, so a search is a matrix multiply
+    followed by a top-k. Payloads come from the store's JSONL sidecar
+    through a byte-offset index. `law_ids` / `doc_ids` restrict the search to
+    the rows whose payload matches, read once per collection on first use.
+    """
+
+    def __init__(self, root: str | Path, block_rows: int = 65536) -> None:
+        self.root = Path(root)
+        self.block_rows = block_rows
+        self._collections: dict[str, tuple[np.ndarray, np.ndarray, mmap.mmap]] = {}
+        self._scope_fields: dict[str, tuple[np.ndarray, np.ndarray]] = {}
+
+    def check_health(self) -> bool:
+        return self.root.exists()
+
+    def prepare(self, collection_name: str) -> Path:
+        """Write the pre-normalized matrix for a collection, if it is missing or stale."""
+        store = EmbeddingStore(self.root / collection_name)
+        path = store.path / NORMALIZED_FILE
+        rows_path = store.path / ROWS_FILE
+        rows = np.flatnonzero(store.live)
+        if path.exists() and rows_path.exists() and np.array_equal(np.load(rows_path), rows):
+            return path
+        out = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=(len(rows), store.dim))
+        for start in range(0, len(rows), self.block_rows):
+            block = np.asarray(store.vectors[rows[start:start + self.block_rows]], dtype=np.float32)
+            norms = np.linalg.norm(block, axis=1, keepdims=True)
+            out[start:start + len(block)] = block / np.maximum(norms, 1e-12)
+        out.flush()
+        del out
+        # Rows last: a crash before this leaves the pair stale, so it is rebuilt
+        np.save(rows_path, rows)
+        return path
+
+    def _collection(self, collection_name: str) -> tuple[np.ndarray, np.ndarray, mmap.mmap]:
+        if collection_name not in self._collections:
+            path = self.prepare(collection_name)
+            matrix = np.load(path, mmap_mode="r")
+            rows = np.load(path.parent / ROWS_FILE)
+            meta_path = self.root / collection_name / "meta.jsonl"
+            with meta_path.open("rb") as f:
+                meta = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            newlines = np.flatnonzero(np.frombuffer(meta, dtype=np.uint8) == ord("\n"))
+            offsets = np.concatenate([[0], newlines + 1]).astype(np.int64)
+            # Byte range of each matrix row's payload line
+            self._collections[collection_name] = (matrix, np.stack([offsets[rows], offsets[rows + 1]], axis=1), meta)
+        return self._collections[collection_name]
+
+    def payload(self, collection_name: str, row: int) -> dict:
+        _, spans, meta = self._collection(collection_name)
+        start, end = spans[row]
+        return json.loads(meta[start:end])
+
+    def scope_rows(self, collection_name: str, law_ids=None, doc_ids=None) -> np.ndarray:
+        """Matrix rows inside a scope."""
+        if collection_name not in self._scope_fields:
+            _, spans, _ = self._collection(collection_name)
+            payloads = [self.payload(collection_name, row) for row in range(len(spans))]
+            self._scope_fields[collection_name] = (
+                np.array([p.get("law_id") for p in payloads], dtype=object),
+                np.array([p.get("doc_id", -1) for p in payloads], dtype=np.int64),
+            )
+        return np.flatnonzero(scope_mask(*self._scope_fields[collection_name], law_ids, doc_ids))
+
+    def top_k(
+        self, collection_name: str, query_vectors, limit: int = 3, rows: np.ndarray | None = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Exact top-k rows and cosine scores, shape (n_queries, limit), best first.
+
+        With `rows`, only those matrix rows are searched.
+        """
+        matrix, _, _ = self._collection(collection_name)
+        if rows is not None:
+            found, scores = self._top_k(matrix[rows], query_vectors, limit)
+            return rows[found], scores
+        return self._top_k(matrix, query_vectors, limit)
+
+    def _top_k(self, matrix: np.ndarray, query_vectors, limit: int) -> tuple[np.ndarray, np.ndarray]:
+        queries = np.asarray(query_vectors, dtype=np.float32)
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        limit = min(limit, matrix.shape[0])
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        for start in range(0, matrix.shape[0], self.block_rows):
+            scores = queries @ matrix[start:start + self.block_rows].T
+            k = min(limit, scores.shape[1])
+            part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            best_rows = np.concatenate([best_rows, part + start], axis=1)
+            best_scores = np.concatenate([best_scores, np.take_along_axis(scores, part, axis=1)], axis=1)
+            if best_rows.shape[1] > limit:
+                keep = np.argpartition(-best_scores, limit - 1, axis=1)[:, :limit]
+                best_rows = np.take_along_axis(best_rows, keep, axis=1)
+                best_scores = np.take_along_axis(best_scores, keep, axis=1)
+        order = np.argsort(-best_scores, axis=1, kind="stable")
+        return np.take_along_axis(best_rows, order, axis=1), np.take_along_axis(best_scores, order, axis=1)
+
+    def search_batch(
+        self,
+        collection_name: str,
+        query_vectors: list[list[float]],
+        limit: int = 3,
+        fields: tuple[str, ...] | None = None,
+        law_ids=None,
+        doc_ids=None,
+    ) -> list[list[dict]]:
+        """See `Qdrant.search_batch`."""
+        if len(query_vectors) == 0:
+            return []
+        scope = None
+        if law_ids is not None or doc_ids is not None:
+            scope = self.scope_rows(collection_name, law_ids, doc_ids)
+        with REGISTRY.timer("local_vector.top_k"):
+            rows, scores = self.top_k(collection_name, query_vectors, limit, scope)
+        results = []
+        for row, score in zip(rows, scores):
+            hits = []
+            for r, s in zip(row, score):
+                payload = self.payload(collection_name, int(r))
+                if fields is not None:
+                    payload = {k: v for k, v in payload.items() if k in fields}
+                hits.append(payload | {"score": float(s)})
+            results.append(hits)
+        return results
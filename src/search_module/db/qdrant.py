@@ -1,18 +1,126 @@
 import os
+import time
+from typing import Iterable, Iterator
 
 from dotenv import load_dotenv
-from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, PointStruct, VectorParams
+from qdrant_client import AsyncQdrantClient, QdrantClient
+from qdrant_client.models import (
+    BinaryQuantization,
+    BinaryQuantizationConfig,
+    CollectionStatus,
+    Distance,
+    FieldCondition,
+    Filter,
+    IntegerIndexParams,
+    IntegerIndexType,
+    KeywordIndexParams,
+    KeywordIndexType,
+    MatchAny,
+    PointIdsList,
+    PointStruct,
+    QuantizationSearchParams,
+    QueryRequest,
+    ScalarQuantization,
+    ScalarQuantizationConfig,
+    ScalarType,
+    SearchParams,
+    VectorParams,
+)
+
+from ..metrics import REGISTRY
 
 load_dotenv()
 
 
+def _connection_kwargs() -> dict:
+    return {
+        "url": os.getenv("QDRANT_HOST", "http://localhost:6333"),
+        "api_key": os.getenv("QDRANT_API_KEY", None),
+    }
+
+
+def _quantization_config(quantization: str | None, always_ram: bool):
+    if quantization is None:
+        return None
+    if quantization == "scalar":
+        return ScalarQuantization(
+            scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99, always_ram=always_ram)
+        )
+    if quantization == "binary":
+        return BinaryQuantization(binary=BinaryQuantizationConfig(always_ram=always_ram))
+    raise ValueError(f"unknown quantization {quantization!r}, expected 'scalar' or 'binary'")
+
+
+# Exact-match indexes for scoped search; integer ones skip the range structure
+PAYLOAD_INDEXES = {
+    "law_id": KeywordIndexParams(type=KeywordIndexType.KEYWORD),
+    "doc_id": IntegerIndexParams(type=IntegerIndexType.INTEGER, lookup=True, range=False),
+    "aid": IntegerIndexParams(type=IntegerIndexType.INTEGER, lookup=True, range=False),
+}
+
+
+def _scope_filter(law_ids: Iterable[str] | None, doc_ids: Iterable[int] | None) -> Filter | None:
+    must = []
+    if law_ids is not None:
+        must.append(FieldCondition(key="law_id", match=MatchAny(any=list(law_ids))))
+    if doc_ids is not None:
+        must.append(FieldCondition(key="doc_id", match=MatchAny(any=list(doc_ids))))
+    return Filter(must=must) if must else None
+
+
+def _search_params(oversampling: float | None, rescore: bool | None) -> SearchParams | None:
+    if oversampling is None and rescore is None:
+        return None
+    return SearchParams(
+        quantization=QuantizationSearchParams(rescore=rescore, oversampling=oversampling)
+    )
+
+
+def _points(datapoints: Iterable[dict], dimensions: int | None = None) -> Iterator[PointStruct]:
+    for data in datapoints:
+        embedding = data.get("embedding", [])
+        if dimensions is not None:
+            # Matryoshka truncation; cosine distance re-normalizes on insert
+            embedding = embedding[:dimensions]
+        payload = {k: v for k, v in data.items() if k != "embedding"}
+        # Use a unique ID (aid) for each point
+        point_id = payload.get("aid")
+        if point_id is None:
+            continue  # skip if no unique id
+        yield PointStruct(id=point_id, vector=embedding, payload=payload)
+
+
+def _query_requests(
+    query_vectors: list[list[float]],
+    limit: int,
+    fields: tuple[str, ...] | None = None,
+    params: SearchParams | None = None,
+    query_filter: Filter | None = None,
+) -> list[QueryRequest]:
+    with_payload = list(fields) if fields is not None else True
+    return [
+        QueryRequest(query=vector, limit=limit, with_payload=with_payload, params=params, filter=query_filter)
+        for vector in query_vectors
+    ]
+
+
+def _parse_responses(responses) -> list[list[dict]]:
+    return [
+        [(hit.payload or {}) | {"score": hit.score} for hit in response.points]
+        for response in responses
+    ]
+
+
 class Qdrant:
+    """Sync Qdrant client for collection setup, uploads and batch search.
+
+    Searches against a quantized collection can pass `oversampling` (fetch
+    `limit * oversampling` candidates from the quantized index) and
+    `rescore` (re-order them with the original vectors).
+    """
+
     def __init__(self) -> None:
-        self.client = QdrantClient(
-            url=os.getenv("QDRANT_HOST", "http://localhost:6333"),
-            api_key=os.getenv("QDRANT_API_KEY", None),
-        )
+        self.client = QdrantClient(**_connection_kwargs())
 
     def check_health(self) -> bool:
         try:
@@ -21,28 +129,173 @@ class Qdrant:
         except Exception as e:
             return False
 
-    def init_collection(self, collection_name: str, embedding_size: int = 1024):
+    def init_collection(
+        self,
+        collection_name: str,
+        embedding_size: int = 1024,
+        quantization: str | None = None,
+        always_ram: bool = True,
+        on_disk: bool = False,
+    ):
+        """Create the collection if it does not exist.
+
+        `embedding_size` below the model size stores Matryoshka-truncated
+        vectors. `quantization` is "scalar" (int8) or "binary"; with
+        `always_ram` the quantized vectors stay in memory, and `on_disk`
+        moves the original vectors (used only for rescoring) to disk.
+        The `PAYLOAD_INDEXES` are ensured on new and existing collections.
+        """
+        created = False
         if not self.client.collection_exists(collection_name):
             self.client.create_collection(
                 collection_name=collection_name,
                 vectors_config=VectorParams(
-                    size=embedding_size, distance=Distance.COSINE
+                    size=embedding_size, distance=Distance.COSINE, on_disk=on_disk
                 ),
+                quantization_config=_quantization_config(quantization, always_ram),
             )
-            return True
-        return False
+            created = True
+        self.ensure_payload_indexes(collection_name)
+        return created
+
+    def ensure_payload_indexes(self, collection_name: str) -> None:
+        """Create the missing `PAYLOAD_INDEXES`, so scoped searches filter through
+        an index instead of reading every candidate's payload."""
+        schema = self.client.get_collection(collection_name).payload_schema
+        for field, params in PAYLOAD_INDEXES.items():
+            if field not in schema:
+                self.client.create_payload_index(collection_name, field_name=field, field_schema=params, wait=True)
     
-    def bulk_upload(self, collection_name: str, datapoints: list[dict]):
-        points = []
-        for data in datapoints:
-            embedding = data.get("embedding", [])
-            payload = {k: v for k, v in data.items() if k != "embedding"}
-            # Use a unique ID (aid) for each point
-            point_id = payload.get("aid")
-            if point_id is None:
-                continue  # skip if no unique id
-            points.append(PointStruct(id=point_id, vector=embedding, payload=payload))
-        return self.client.upsert(collection_name=collection_name, points=points)
+    def bulk_upload(self, collection_name: str, datapoints: list[dict], dimensions: int | None = None):
+        """Upsert and return once the points are applied."""
+        return self.client.upsert(
+            collection_name=collection_name, points=list(_points(datapoints, dimensions)), wait=True
+        )
+
+    def upload_stream(
+        self,
+        collection_name: str,
+        datapoints: Iterable[dict],
+        batch_size: int = 256,
+        parallel: int = 4,
+        dimensions: int | None = None,
+        method: str | None = None,
+    ) -> int:
+        """Stream datapoints through `upload_points` in parallel batches without waiting
+        for each batch to be applied. `dimensions` truncates the embeddings.
+
+        With `parallel` > 1 the batches go through a multiprocessing pool
+        started with `method` ("spawn", "fork", ...; None is the platform
+        default). Spawned workers re-import the caller's main module, so it
+        must keep its work under `if __name__ == "__main__":`.
+
+        Returns the number of points sent; `wait_applied` confirms them.
+        """
+        sent = 0
+
+        def counted() -> Iterator[PointStruct]:
+            nonlocal sent
+            for point in _points(datapoints, dimensions):
+                sent += 1
+                yield point
+
+        self.client.upload_points(
+            collection_name=collection_name,
+            points=counted(),
+            batch_size=batch_size,
+            parallel=parallel,
+            method=method,
+            wait=False,
+        )
+        return sent
+
+    def wait_applied(self, collection_name: str, points: int, timeout: float = 3600.0) -> None:
+        """Wait until the collection holds at least `points` points and its
+        optimizers are idle (status green); raises TimeoutError past `timeout` seconds."""
+        deadline = time.monotonic() + timeout
+        while True:
+            info = self.client.get_collection(collection_name)
+            if info.status == CollectionStatus.GREEN and (info.points_count or 0) >= points:
+                return
+            if time.monotonic() >= deadline:
+                raise TimeoutError(
+                    f"{collection_name}: {info.points_count} of {points} points, status {info.status}, after {timeout}s"
+                )
+            time.sleep(2)
+
+    def delete(self, collection_name: str, aids: list[int]):
+        """Delete points by aid and return once the deletion is applied."""
+        return self.client.delete(
+            collection_name=collection_name, points_selector=PointIdsList(points=aids), wait=True
+        )
+
+    def search_batch(
+        self,
+        collection_name: str,
+        query_vectors: list[list[float]],
+        limit: int = 3,
+        fields: tuple[str, ...] | None = None,
+        oversampling: float | None = None,
+        rescore: bool | None = None,
+        law_ids: Iterable[str] | None = None,
+        doc_ids: Iterable[int] | None = None,
+    ) -> list[list[dict]]:
+        """Search many vectors in one request; returns payload + score hits per vector.
+
+        `fields` limits the returned payload keys; `None` returns the whole payload.
+        `law_ids` / `doc_ids` restrict every query to those laws / documents.
+        """
+        if not query_vectors:
+            return []
+        with REGISTRY.timer("qdrant.query_batch"):
+            responses = self.client.query_batch_points(
+                collection_name=collection_name,
+                requests=_query_requests(
+                    query_vectors,
+                    limit,
+                    fields,
+                    _search_params(oversampling, rescore),
+                    _scope_filter(law_ids, doc_ids),
+                ),
+            )
+            return _parse_responses(responses)
+
+
+class AsyncQdrant:
+    """asyncio counterpart of `Qdrant` for the search path."""
+
+    def __init__(self) -> None:
+        self.client = AsyncQdrantClient(**_connection_kwargs())
+
+    async def close(self) -> None:
+        await self.client.close()
+
+    async def search_batch(
+        self,
+        collection_name: str,
+        query_vectors: list[list[float]],
+        limit: int = 3,
+        fields: tuple[str, ...] | None = None,
+        oversampling: float | None = None,
+        rescore: bool | None = None,
+        law_ids: Iterable[str] | None = None,
+        doc_ids: Iterable[int] | None = None,
+    ) -> list[list[dict]]:
+        """See `Qdrant.search_batch`."""
+        if not query_vectors:
+            return []
+        with REGISTRY.timer("qdrant.query_batch"):
+            responses = await self.client.query_batch_points(
+                collection_name=collection_name,
+                requests=_query_requests(
+                    query_vectors,
+                    limit,
+                    fields,
+                    _search_params(oversampling, rescore),
+                    _scope_filter(law_ids, doc_ids),
+                ),
+            )
+            return _parse_responses(responses)
 
 
 if __name__ == "__main__":
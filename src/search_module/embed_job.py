@@ -0,0 +1,156 @@
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import requests
+from .embedding_store import EmbeddingStore
+from .jina_client import EMBED_MAX_TOKENS, Jina, JinaError, pack_batches
+
+
+class AdaptiveBackoff:
+    """Shared pause for every worker once the API pushes back.
+
+    Each 429/5xx doubles the delay (or takes the server's Retry-After),
+    up to `max_delay`. All workers wait until the pause ends, so the job
+    backs off as a whole instead of each thread hammering the API. Each
+    success shrinks the delay again.
+    """
+
+    def __init__(self, base_delay: float = 1.0, max_delay: float = 60.0) -> None:
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.delay = 0.0
+        self.resume_at = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        with self._lock:
+            pause = self.resume_at - time.monotonic()
+        if pause > 0:
+            time.sleep(pause)
+
+    def failure(self, retry_after: float | None = None) -> float:
+        with self._lock:
+            self.delay = min(self.max_delay, max(self.base_delay, self.delay * 2))
+            delay = retry_after if retry_after is not None else self.delay * random.uniform(0.5, 1.0)
+            self.resume_at = max(self.resume_at, time.monotonic() + delay)
+            return delay
+
+    def success(self) -> None:
+        with self._lock:
+            self.delay /= 2
+            if self.delay < self.base_delay:
+                self.delay = 0.0
+
+
+class EmbedJob:
+    """Embeds items into an `EmbeddingStore` with `in_flight` concurrent batches.
+
+    Batches may finish in any order, but they are committed to the store
+    strictly in order, and each commit is durable on its own. The store is
+    the checkpoint: running the job again skips every committed aid and
+    resumes from the first uncommitted batch. Retryable errors (429, 5xx,
+    connection errors, timeouts) go through the shared `AdaptiveBackoff`.
+    Other errors stop the job. With a cache on the client, cached texts are
+    not sent again.
+
+    Batches hold at most `batch_size` items and stay within the client's
+    token and byte budgets. They are cut in input order, so the commit
+    order is unchanged.
+    """
+
+    def __init__(
+        self,
+        jina: Jina,
+        store: EmbeddingStore,
+        batch_size: int = 32,
+        in_flight: int = 4,
+        max_retries: int = 8,
+        task: str = "",
+        text_key: str = "content_Article",
+    ) -> None:
+        self.jina = jina
+        self.store = store
+        self.batch_size = batch_size
+        self.in_flight = in_flight
+        self.max_retries = max_retries
+        self.task = task
+        self.text_key = text_key
+        self.backoff = AdaptiveBackoff()
+        self.items_done = 0
+        self.tokens_done = 0
+        self.retries = 0
+
+    def _embed(self, batch: list[dict]) -> tuple[list[list[float]], int]:
+        texts = [item[self.text_key] for item in batch]
+        attempt = 0
+        while True:
+            self.backoff.wait()
+            try:
+                embeddings, tokens = self.jina.embed_with_usage(texts, self.task)
+            except JinaError as e:
+                if not e.retryable or attempt == self.max_retries:
+                    raise
+                retry_after = e.retry_after
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.max_retries:
+                    raise
+                retry_after = None
+            else:
+                if len(embeddings) != len(batch):
+                    raise ValueError(f"got {len(embeddings)} embeddings for {len(batch)} texts")
+                self.backoff.success()
+                return embeddings, tokens
+            attempt += 1
+            self.retries += 1
+            delay = self.backoff.failure(retry_after)
+            print(f"[Retry] aid {batch[0]['aid']}..{batch[-1]['aid']} in {delay:.1f}s (attempt {attempt})")
+
+    def run(self, items: list[dict]) -> None:
+        to_embed = [item for item in items if self.store.row(item["aid"]) is None]
+        batches = [
+            [to_embed[i] for i in batch]
+            for batch in pack_batches(
+                [item[self.text_key] for item in to_embed],
+                self.batch_size,
+                EMBED_MAX_TOKENS,
+                self.jina.token_budget,
+                self.jina.byte_budget,
+                sort=False,
+            )
+        ]
+        print(f"{len(self.store)} entries committed, {len(to_embed)} left in {len(batches)} batches.")
+
+        start_time = time.perf_counter()
+        futures: dict[int, Future] = {}
+        next_submit = 0
+        with ThreadPoolExecutor(max_workers=self.in_flight) as executor:
+            for next_commit, batch in enumerate(batches):
+                # Queue a little ahead so a worker never idles while the head batch is committed
+                while next_submit < len(batches) and next_submit < next_commit + 2 * self.in_flight:
+                    futures[next_submit] = executor.submit(self._embed, batches[next_submit])
+                    next_submit += 1
+                try:
+                    embeddings, tokens = futures.pop(next_commit).result()
+                except Exception:
+                    for future in futures.values():
+                        future.cancel()
+                    raise
+                self.store.append([item["aid"] for item in batch], embeddings, batch)
+                self.items_done += len(batch)
+                self.tokens_done += tokens
+
+                elapsed = time.perf_counter() - start_time
+                print(
+                    f"Committed aid {batch[0]['aid']}..{batch[-1]['aid']} | "
+                    f"{self.items_done}/{len(to_embed)} items | "
+                    f"{self.items_done / elapsed:.1f} items/s | {self.tokens_done / elapsed:.0f} tokens/s"
+                )
+        elapsed = time.perf_counter() - start_time
+        if to_embed:
+            print(
+                f"Embedded {self.items_done} items ({self.tokens_done} tokens) in {elapsed:.1f}s: "
+                f"{self.items_done / elapsed:.1f} items/s, {self.tokens_done / elapsed:.0f} tokens/s, "
+                f"{self.retries} retries."
+            )
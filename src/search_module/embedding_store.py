@@ -0,0 +1,207 @@
+import ast
+import json
+import os
+from pathlib import Path
+from typing import Iterator
+
+import numpy as np
+
+HEADER_LEN = 128  # fixed-size .npy header so the row count can be rewritten in place
+MAGIC = b"\x93NUMPY\x01\x00"
+
+
+def _npy_header(n_rows: int, dim: int, dtype: np.dtype) -> bytes:
+    header = repr({"descr": dtype.str, "fortran_order": False, "shape": (n_rows, dim)})
+    pad = HEADER_LEN - len(MAGIC) - 2 - len(header) - 1
+    header = (header + " " * pad + "\n").encode("latin1")
+    return MAGIC + len(header).to_bytes(2, "little") + header
+
+
+def _read_npy_header(path: Path) -> tuple[int, int, np.dtype]:
+    with path.open("rb") as f:
+        raw = f.read(HEADER_LEN)
+    if raw[:len(MAGIC)] != MAGIC:
+        raise ValueError(f"{path} is not an embedding store matrix")
+    header = ast.literal_eval(raw[len(MAGIC) + 2:].decode("latin1"))
+    n_rows, dim = header["shape"]
+    return n_rows, dim, np.dtype(header["descr"])
+
+
+class EmbeddingStore:
+    """Append-only on-disk embedding store.
+
+    A store is a directory holding:
+    - `vectors.npy`: an (n, dim) float32/float16 matrix with a fixed-size
+      .npy header, so `np.load(..., mmap_mode="r")` can read it too;
+    - `aids.bin`: int64 aids, one per matrix row;
+    - `meta.jsonl`: one JSON object per row (everything but the embedding);
+    - `removed.bin`: (aid, row count at removal) int64 pairs, written by `remove`.
+
+    A later row for the same aid supersedes the earlier one, and a removal
+    hides every row written before it. `len`, `row` and `iter_batches` only
+    see the live rows; `vectors` and `aids` are the raw physical rows.
+
+    `append` writes one batch to the three files, fsyncs them, and then
+    rewrites the row count in the matrix header. That header write is the
+    commit point. When a store is reopened for writing, rows past the
+    committed count are truncated away. Readers get memory-mapped,
+    zero-copy views of the committed rows.
+    """
+
+    def __init__(
+        self, path: str | Path, dim: int = 1024, dtype: str = "float32", mode: str = "r"
+    ) -> None:
+        self.path = Path(path)
+        self.mode = mode
+        self.vectors_path = self.path / "vectors.npy"
+        self.aids_path = self.path / "aids.bin"
+        self.meta_path = self.path / "meta.jsonl"
+        self.removed_path = self.path / "removed.bin"
+        if mode == "a" and not self.vectors_path.exists():
+            self.path.mkdir(parents=True, exist_ok=True)
+            self.vectors_path.write_bytes(_npy_header(0, dim, np.dtype(dtype)))
+            self.aids_path.write_bytes(b"")
+            self.meta_path.write_bytes(b"")
+        self.n_rows, self.dim, self.dtype = _read_npy_header(self.vectors_path)
+        if mode == "a":
+            self._truncate_uncommitted()
+        self._vectors = None
+        self._aids = None
+        self._row_index = None
+        self._live = None
+
+    def __len__(self) -> int:
+        return len(self._index())
+
+    def _truncate_uncommitted(self) -> None:
+        row_bytes = self.dim * self.dtype.itemsize
+        with self.vectors_path.open("r+b") as f:
+            f.truncate(HEADER_LEN + self.n_rows * row_bytes)
+        with self.aids_path.open("r+b") as f:
+            f.truncate(self.n_rows * 8)
+        offset = 0
+        with self.meta_path.open("rb") as f:
+            for _ in range(self.n_rows):
+                offset += len(f.readline())
+        with self.meta_path.open("r+b") as f:
+            f.truncate(offset)
+        if self.removed_path.exists():
+            with self.removed_path.open("r+b") as f:
+                f.truncate(self.removed_path.stat().st_size // 16 * 16)
+
+    def append(self, aids: list[int], vectors, metadata: list[dict]) -> None:
+        """Durably append one batch of rows (the unit of checkpointing)."""
+        if self.mode != "a":
+            raise ValueError("store was opened read-only")
+        matrix = np.asarray(vectors, dtype=self.dtype)
+        if matrix.shape != (len(aids), self.dim) or len(metadata) != len(aids):
+            raise ValueError(
+                f"batch shape {matrix.shape} does not match {len(aids)} aids of dim {self.dim}"
+            )
+        for file_path, data in (
+            (self.vectors_path, matrix.tobytes()),
+            (self.aids_path, np.asarray(aids, dtype=np.int64).tobytes()),
+            (
+                self.meta_path,
+                "".join(json.dumps(m, ensure_ascii=False) + "\n" for m in metadata).encode("utf-8"),
+            ),
+        ):
+            with file_path.open("ab") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+        with self.vectors_path.open("r+b") as f:
+            f.write(_npy_header(self.n_rows + len(aids), self.dim, self.dtype))
+            f.flush()
+            os.fsync(f.fileno())
+        if self._row_index is not None:
+            self._row_index.update((int(a), self.n_rows + i) for i, a in enumerate(aids))
+        self.n_rows += len(aids)
+        self._vectors = self._aids = self._live = None
+
+    def remove(self, aids: list[int]) -> None:
+        """Durably hide every row stored so far for these aids."""
+        if self.mode != "a":
+            raise ValueError("store was opened read-only")
+        pairs = np.asarray([(aid, self.n_rows) for aid in aids], dtype=np.int64)
+        with self.removed_path.open("ab") as f:
+            f.write(pairs.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        if self._row_index is not None:
+            for aid in aids:
+                self._row_index.pop(int(aid), None)
+        self._live = None
+
+    def _index(self) -> dict[int, int]:
+        """aid -> its live row."""
+        if self._row_index is None:
+            index = {int(a): i for i, a in enumerate(self.aids)}
+            if self.removed_path.exists():
+                for aid, before in np.fromfile(self.removed_path, dtype=np.int64).reshape(-1, 2).tolist():
+                    if index.get(aid, before) < before:
+                        del index[aid]
+            self._row_index = index
+        return self._row_index
+
+    @property
+    def live(self) -> np.ndarray:
+        """Boolean mask over the physical rows: True for each aid's live row."""
+        if self._live is None:
+            live = np.zeros(self.n_rows, dtype=bool)
+            live[np.fromiter(self._index().values(), dtype=np.int64)] = True
+            self._live = live
+        return self._live
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """Memory-mapped (n, dim) matrix of committed rows."""
+        if self._vectors is None:
+            if self.n_rows == 0:
+                self._vectors = np.empty((0, self.dim), dtype=self.dtype)
+            else:
+                self._vectors = np.memmap(
+                    self.vectors_path, dtype=self.dtype, mode="r",
+                    offset=HEADER_LEN, shape=(self.n_rows, self.dim),
+                )
+        return self._vectors
+
+    @property
+    def aids(self) -> np.ndarray:
+        if self._aids is None:
+            if self.n_rows == 0:
+                self._aids = np.empty(0, dtype=np.int64)
+            else:
+                self._aids = np.memmap(self.aids_path, dtype=np.int64, mode="r", shape=(self.n_rows,))
+        return self._aids
+
+    def row(self, aid: int) -> int | None:
+        return self._index().get(int(aid))
+
+    def get(self, aid: int) -> np.ndarray | None:
+        """Zero-copy view of one aid's vector."""
+        row = self.row(aid)
+        return None if row is None else self.vectors[row]
+
+    def iter_batches(self, batch_size: int = 1024) -> Iterator[tuple[list[dict], np.ndarray]]:
+        """Yield (metadata, vectors) of the live rows per batch, streaming the JSONL sidecar."""
+        live = self.live
+        with self.meta_path.open("r", encoding="utf-8") as f:
+            for start in range(0, self.n_rows, batch_size):
+                end = min(start + batch_size, self.n_rows)
+                lines = [f.readline() for _ in range(end - start)]
+                keep = np.flatnonzero(live[start:end])
+                if len(keep) == end - start:
+                    yield [json.loads(line) for line in lines], self.vectors[start:end]
+                elif len(keep):
+                    yield [json.loads(lines[i]) for i in keep], self.vectors[start:end][keep]
+
+    def extend_from(self, other: "EmbeddingStore", batch_size: int = 1024) -> int:
+        """Append every row of `other` whose aid is not stored yet; returns rows added."""
+        added = 0
+        for metadata, vectors in other.iter_batches(batch_size):
+            keep = [i for i, m in enumerate(metadata) if self.row(m["aid"]) is None]
+            if keep:
+                self.append([metadata[i]["aid"] for i in keep], vectors[keep], [metadata[i] for i in keep])
+                added += len(keep)
+        return added
@@ -0,0 +1,196 @@
+import argparse
+import json
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterable, Iterator
+
+import numpy as np
+
+DEFAULT_KS = (1, 2, 3, 5, 10)
+
+
+def read_run(path: str | Path) -> Iterator[dict]:
+    """Yield {"qid", "relevant_laws"} records from a JSONL run, line by line.
+
+    A `.json` file (the format `evaluate_results` reads) is loaded whole.
+    """
+    path = Path(path)
+    if path.suffix == ".json":
+        yield from json.loads(path.read_text(encoding="utf-8"))
+        return
+    with path.open(encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def load_ground_truth(path: str | Path) -> dict:
+    return {entry["qid"]: entry["relevant_laws"] for entry in read_run(path)}
+
+
+def f2_score(precision, recall):
+    """F2 of averaged precision and recall, as in `evaluate_results.calculate_metrics`."""
+    denominator = 4 * precision + recall
+    return np.where(denominator > 0, 5 * precision * recall / np.where(denominator > 0, denominator, 1), 0.0)
+
+
+class Evaluator:
+    """Single-pass ranked metrics over a stream of run records.
+
+    Records are buffered into chunks of `chunk_size`. Each chunk becomes a
+    (queries x max k) hit matrix, and every metric at every k comes from
+    cumulative sums over it. Only per-metric running sums are kept, so memory
+    does not grow with the run.
+
+    P@k divides by min(k, retrieved), so at a k past the list length it equals
+    the set-based precision of `evaluate_results`. F2@k is computed from the
+    averaged P@k and R@k in the same way. nDCG uses binary gains. MRR is cut
+    at the largest k.
+
+    With `bootstrap` > 0 a Poisson bootstrap runs alongside: each query gets
+    a Poisson(1) weight per replicate, and only the weighted sums are kept.
+    `result()` then adds 95% intervals under "ci".
+    """
+
+    def __init__(
+        self,
+        ground_truth: dict,
+        ks: Iterable[int] = DEFAULT_KS,
+        bootstrap: int = 0,
+        chunk_size: int = 4096,
+        seed: int = 0,
+    ) -> None:
+        self.ground_truth = {qid: list(set(relevant)) for qid, relevant in ground_truth.items()}
+        self.ks = np.array(sorted(set(ks)), dtype=np.int64)
+        self.max_k = int(self.ks[-1])
+        discounts = 1.0 / np.log2(np.arange(2, self.max_k + 2))
+        self.discounts = discounts
+        self.ideal = np.concatenate([[0.0], np.cumsum(discounts)])  # ideal DCG with m relevant in the top
+        self.names = [
+            f"{metric}@{k}" for metric in ("precision", "recall", "ndcg", "hit_rate") for k in self.ks
+        ] + [f"mrr@{self.max_k}"]
+        self.chunk_size = chunk_size
+        self.bootstrap = bootstrap
+        self.rng = np.random.default_rng(seed)
+        self.count = 0
+        self.sums = np.zeros(len(self.names))
+        self.boot_counts = np.zeros(bootstrap)
+        self.boot_sums = np.zeros((bootstrap, len(self.names)))
+        self._pending: list[dict] = []
+
+    def add(self, record: dict) -> None:
+        self._pending.append(record)
+        if len(self._pending) >= self.chunk_size:
+            self._flush()
+
+    def add_many(self, records: Iterable[dict]) -> "Evaluator":
+        for record in records:
+            self.add(record)
+        return self
+
+    def _hits(self, records: list[dict]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Hit matrix (n x max_k), retrieved counts and relevant counts for a chunk."""
+        n = len(records)
+        # Repeated aids count once, as in the set-based metrics; the first position wins
+        ranked = [list(dict.fromkeys(record.get("relevant_laws", [])))[:self.max_k] for record in records]
+        relevant = [self.ground_truth.get(record["qid"], []) for record in records]
+        retrieved_counts = np.fromiter((len(r) for r in ranked), dtype=np.int64, count=n)
+        relevant_counts = np.fromiter((len(r) for r in relevant), dtype=np.int64, count=n)
+        flat_ranked = np.fromiter((aid for r in ranked for aid in r), dtype=np.int64)
+        flat_relevant = np.fromiter((aid for r in relevant for aid in r), dtype=np.int64)
+        rows = np.repeat(np.arange(n), retrieved_counts)
+        cols = np.arange(len(flat_ranked)) - np.repeat(np.cumsum(retrieved_counts) - retrieved_counts, retrieved_counts)
+        # (row, aid) pairs as single int64 keys, so membership is one np.isin per chunk
+        span = int(max(flat_ranked.max(initial=0), flat_relevant.max(initial=0))) + 1
+        found = np.isin(
+            rows * span + flat_ranked,
+            np.repeat(np.arange(n), [len(r) for r in relevant]) * span + flat_relevant,
+        )
+        hits = np.zeros((n, self.max_k), dtype=bool)
+        hits[rows[found], cols[found]] = True
+        return hits, retrieved_counts, relevant_counts
+
+    def _flush(self) -> None:
+        if not self._pending:
+            return
+        hits, retrieved, relevant = self._hits(self._pending)
+        self._pending = []
+        at = self.ks - 1
+        correct = np.cumsum(hits, axis=1)[:, at]
+        cut = np.minimum(retrieved[:, None], self.ks)
+        precision = np.where(cut > 0, correct / np.maximum(cut, 1), 0.0)
+        recall = np.where(relevant[:, None] > 0, correct / np.maximum(relevant[:, None], 1), 0.0)
+        dcg = np.cumsum(hits * self.discounts, axis=1)[:, at]
+        ideal = self.ideal[np.minimum(relevant[:, None], self.ks)]
+        ndcg = np.where(ideal > 0, dcg / np.where(ideal > 0, ideal, 1), 0.0)
+        hit_rate = (correct > 0).astype(np.float64)
+        first = np.argmax(hits, axis=1)
+        rr = np.where(hits.any(axis=1), 1.0 / (first + 1), 0.0)
+        values = np.hstack([precision, recall, ndcg, hit_rate, rr[:, None]])
+
+        self.count += len(values)
+        self.sums += values.sum(axis=0)
+        if self.bootstrap:
+            weights = self.rng.poisson(1.0, size=(self.bootstrap, len(values)))
+            self.boot_counts += weights.sum(axis=1)
+            self.boot_sums += weights @ values
+
+    def _with_f2(self, means: np.ndarray) -> np.ndarray:
+        """Append F2@k columns computed from the P@k and R@k columns of `means` (..., metrics)."""
+        n_k = len(self.ks)
+        return np.concatenate([means, f2_score(means[..., :n_k], means[..., n_k:2 * n_k])], axis=-1)
+
+    def result(self) -> dict:
+        self._flush()
+        names = self.names + [f"f2@{k}" for k in self.ks]
+        means = self._with_f2(self.sums / max(self.count, 1))
+        result = {"queries": self.count} | {name: float(v) for name, v in zip(names, means)}
+        if self.bootstrap:
+            replicates = self._with_f2(self.boot_sums / np.maximum(self.boot_counts, 1)[:, None])
+            low, high = np.percentile(replicates, [2.5, 97.5], axis=0)
+            result["ci"] = {name: [float(l), float(h)] for name, l, h in zip(names, low, high)}
+        return result
+
+
+def evaluate(
+    ground_truth_path: str | Path,
+    run_path: str | Path,
+    ks: Iterable[int] = DEFAULT_KS,
+    bootstrap: int = 0,
+    seed: int = 0,
+) -> dict:
+    evaluator = Evaluator(load_ground_truth(ground_truth_path), ks, bootstrap=bootstrap, seed=seed)
+    return evaluator.add_many(read_run(run_path)).result()
+
+
+def evaluate_many(
+    ground_truth_path: str | Path,
+    run_paths: list[str | Path],
+    ks: Iterable[int] = DEFAULT_KS,
+    bootstrap: int = 0,
+    workers: int | None = None,
+) -> list[dict]:
+    """Evaluate several runs in parallel processes; results keep the input order."""
+    ks = list(ks)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(evaluate, ground_truth_path, path, ks, bootstrap) for path in run_paths]
+        return [{"run": str(path)} | future.result() for path, future in zip(run_paths, futures)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ranked retrieval metrics for one or more runs")
+    parser.add_argument("ground_truth", help="train.json or a JSONL file with qid / relevant_laws")
+    parser.add_argument("runs", nargs="+", help="run files (.jsonl streamed, .json loaded whole)")
+    parser.add_argument("--k", type=lambda v: [int(k) for k in v.split(",")], default=list(DEFAULT_KS))
+    parser.add_argument("--bootstrap", type=int, default=0, help="bootstrap replicates for 95%% intervals")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    for result in evaluate_many(args.ground_truth, args.runs, args.k, args.bootstrap, args.workers):
+        print(f"=== {result['run']} ({result['queries']} queries) ===")
+        for name, value in result.items():
+            if name in ("run", "queries", "ci"):
+                continue
+            interval = result.get("ci", {}).get(name)
+            suffix = f"  [{interval[0]:.4f}, {interval[1]:.4f}]" if interval else ""
+            print(f"{name:>14}: {value:.4f}{suffix}")
@@ -0,0 +1,52 @@
+import asyncio
+import json
+import time
+from pathlib import Path
+
+from ..cache import EmbeddingCache
+from ..db.elastic import AsyncElastic
+from ..db.qdrant import AsyncQdrant
+from ..jina_client import AsyncJina
+from ..pipeline import AsyncHybridPipeline
+
+
+async def main(db_name: str, queries: list[dict]) -> list[dict]:
+    jina = AsyncJina(cache=EmbeddingCache(r"d:\Work\VLSP\Dataset\embedding_cache.sqlite"))
+    qdrant = AsyncQdrant()
+    elastic = AsyncElastic()
+    pipeline = AsyncHybridPipeline(
+        jina,
+        qdrant,
+        elastic,
+        db_name,
+        # Per-stage in-flight caps; tune to each service's capacity
+        concurrency={"embed": 16, "qdrant": 32, "elastic": 32, "rerank": 8},
+    )
+    try:
+        start = time.perf_counter()
+        results = await pipeline.run(queries)
+        elapsed = time.perf_counter() - start
+        print(f"Searched {len(results)} queries in {elapsed:.2f}s ({len(results) / elapsed:.1f} q/s)")
+        return results
+    finally:
+        await jina.close()
+        await qdrant.close()
+        await elastic.close()
+
+
+if __name__ == "__main__":
+    db_name = "legal_corpus"
+
+    # Load queries
+    queries_path = r"d:\Work\VLSP\Dataset\train.json"
+    queries_data = json.loads(Path(queries_path).read_text(encoding="utf-8"))
+    queries = [{"qid": item["qid"], "question": item["question"]} for item in queries_data]
+
+    print("Queries size:", len(queries))
+
+    final_results = asyncio.run(main(db_name, queries))
+
+    # --- Save results ---
+    output_path = Path(r"d:\Work\VLSP\Dataset\train_results.json")
+    output_path.write_text(json.dumps(final_results, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"\nResults saved to: {output_path}")
@@ -0,0 +1,40 @@
+import json
+import time
+from pathlib import Path
+
+from ..bulk import merge, run_bulk
+from ..cache import EmbeddingCache, RerankCache
+from ..jina_client import Jina
+from ..searcher import HybridSearcher
+
+
+def make_searcher() -> HybridSearcher:
+    # Called once in every worker process
+    return HybridSearcher(
+        db_name="legal_corpus",
+        jina=Jina(
+            cache=EmbeddingCache(r"d:\Work\VLSP\Dataset\embedding_cache.sqlite"),
+            rerank_cache=RerankCache(r"d:\Work\VLSP\Dataset\rerank_cache.sqlite"),
+        ),
+        elastic_size=10,
+        embed_batch_size=64,
+        # Fusion and the rerank gate are opt-in; turn them on once a sweep (flow/sweep.py) shows they help, e.g.
+        # fusion=Fusion("rrf", dense_depth=3, lexical_depth=10), gate=RerankGate(agree_depth=2, shrink_to=5)
+    )
+
+
+if __name__ == "__main__":
+    queries_path = r"d:\Work\VLSP\Dataset\train.json"
+    queries_data = json.loads(Path(queries_path).read_text(encoding="utf-8"))
+    queries = [{"qid": item["qid"], "question": item["question"]} for item in queries_data]
+    print("Queries size:", len(queries))
+
+    # Re-running after an interruption only searches the qids not yet in the shard files
+    shard_dir = Path(r"d:\Work\VLSP\Dataset\train_results_shards")
+    start_time = time.perf_counter()
+    written = run_bulk(queries, shard_dir, shards=4, searcher_factory=make_searcher, batch_size=64)
+    print(f"Wrote {written} queries in {time.perf_counter() - start_time:.2f}s")
+
+    output_path = Path(r"d:\Work\VLSP\Dataset\train_results.json")
+    missing = merge(shard_dir, queries, output_path)
+    print(f"\nResults saved to: {output_path}" + (f" ({missing} questions missing)" if missing else ""))
@@ -2,6 +2,8 @@ import json
 from pathlib import Path
 from typing import Union
 
+from ..embedding_store import EmbeddingStore
+
 def combine_json_files(file1: Union[str, Path], file2: Union[str, Path], output_file: Union[str, Path]) -> None:
     # Read both JSON files
     with open(file1, "r", encoding="utf-8") as f1, open(file2, "r", encoding="utf-8") as f2:
@@ -20,10 +22,29 @@ def combine_json_files(file1: Union[str, Path], file2: Union[str, Path], output_
     with open(output_file, "w", encoding="utf-8") as out:
         json.dump(combined, out, ensure_ascii=False, indent=2)
 
+def json_to_store(json_file: Union[str, Path], store_path: Union[str, Path], batch_size: int = 1024) -> EmbeddingStore:
+    """Convert a legacy embedded-corpus JSON list into an `EmbeddingStore` (one-off migration)."""
+    data = json.loads(Path(json_file).read_text(encoding="utf-8"))
+    store = EmbeddingStore(store_path, dim=len(data[0]["embedding"]), mode="a")
+    for start in range(0, len(data), batch_size):
+        batch = [item for item in data[start:start + batch_size] if store.row(item["aid"]) is None]
+        if batch:
+            store.append(
+                [item["aid"] for item in batch],
+                [item["embedding"] for item in batch],
+                [{k: v for k, v in item.items() if k != "embedding"} for item in batch],
+            )
+    return store
+
+def combine_stores(store1: Union[str, Path], store2: Union[str, Path]) -> EmbeddingStore:
+    """Append the rows of store2 that store1 does not have yet into store1, in place."""
+    combined = EmbeddingStore(store1, mode="a")
+    combined.extend_from(EmbeddingStore(store2))
+    return combined
+
 if __name__ == "__main__":
-    output_path_1 = Path(r"d:\Work\VLSP\Dataset\legal_corpus_embedded_combined.json")
-    output_path_2 = Path(r"d:\Work\VLSP\Dataset\legal_corpus_embedded.json")
-    output_file = Path(r"d:\Work\VLSP\Dataset\legal_corpus_embedded_combined.json")
+    output_path_1 = Path(r"d:\Work\VLSP\Dataset\legal_corpus_embedded_combined")
+    output_path_2 = Path(r"d:\Work\VLSP\Dataset\legal_corpus_embedded")
 
-    combine_json_files(output_path_1, output_path_2, output_file)
-    print(f"Combined JSON files saved to {output_file} with {len(json.load(open(output_file, 'r', encoding='utf-8')))} entries.")
\ No newline at end of file
+    combined = combine_stores(output_path_1, output_path_2)
+    print(f"Combined embedding stores saved to {combined.path} with {len(combined)} entries.")
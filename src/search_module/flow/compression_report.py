@@ -0,0 +1,138 @@
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+
+from ..cache import EmbeddingCache
+from ..db.qdrant import Qdrant
+from ..embedding_store import EmbeddingStore
+from ..ingest import store_datapoints
+from ..jina_client import Jina
+
+# Each variant is a separate collection built from the same stored embeddings.
+# Truncating a stored vector to its first `dimensions` values is what the
+# Jina API does for Matryoshka embeddings; cosine distance re-normalizes.
+VARIANTS = [
+    {"name": "full"},
+    {"name": "scalar", "quantization": "scalar", "oversampling": 2.0, "rescore": True},
+    {"name": "binary", "quantization": "binary", "oversampling": 3.0, "rescore": True},
+    {"name": "d512", "dimensions": 512},
+    {"name": "d256", "dimensions": 256},
+    {"name": "d512_scalar", "dimensions": 512, "quantization": "scalar", "oversampling": 2.0, "rescore": True},
+]
+# Bytes per dimension held in RAM for the original vectors and for each quantization
+BYTES_PER_DIM = {None: 4, "scalar": 1, "binary": 1 / 8}
+
+
+def collection_name(db_name: str, variant: dict) -> str:
+    return db_name if variant["name"] == "full" else f"{db_name}_{variant['name']}"
+
+
+def ram_bytes(points: int, dim: int, variant: dict) -> int:
+    """Estimated resident vector memory: quantized vectors plus originals unless on disk."""
+    quantization = variant.get("quantization")
+    total = 0 if variant.get("on_disk") else points * dim * BYTES_PER_DIM[None]
+    if quantization is not None:
+        total += points * dim * BYTES_PER_DIM[quantization]
+    return int(total)
+
+
+def build(qdrant: Qdrant, store: EmbeddingStore, db_name: str, variant: dict, timeout: float = 3600.0) -> None:
+    """Create and fill the variant's collection if it is new, then wait until
+    every uploaded point is applied and the index is optimized.
+
+    Raises TimeoutError if that takes longer than `timeout` seconds.
+    """
+    name = collection_name(db_name, variant)
+    dim = variant.get("dimensions") or store.dim
+    uploaded = 0
+    if qdrant.init_collection(
+        name,
+        embedding_size=dim,
+        quantization=variant.get("quantization"),
+        on_disk=variant.get("on_disk", False),
+    ):
+        print(f"[{variant['name']}] uploading {len(store)} points at {dim} dims")
+        points = (point for batch in store_datapoints(store, 256) for point in batch)
+        uploaded = qdrant.upload_stream(name, points, dimensions=variant.get("dimensions"))
+    qdrant.wait_applied(name, uploaded, timeout)
+
+
+def search(qdrant: Qdrant, name: str, vectors: list[list[float]], variant: dict, limit: int, batch_size: int):
+    """Return the aid lists per query and the per-query latency (batch time / batch size) in ms."""
+    aids, latencies = [], []
+    for start in range(0, len(vectors), batch_size):
+        batch = vectors[start:start + batch_size]
+        t0 = time.perf_counter()
+        hits = qdrant.search_batch(
+            name,
+            batch,
+            limit=limit,
+            fields=("aid",),
+            oversampling=variant.get("oversampling"),
+            rescore=variant.get("rescore"),
+        )
+        elapsed = (time.perf_counter() - t0) * 1000
+        latencies.extend([elapsed / len(batch)] * len(batch))
+        aids.extend([hit["aid"] for hit in query_hits] for query_hits in hits)
+    return aids, latencies
+
+
+def overlap(found: list[list], reference: list[list]) -> float:
+    """Mean share of the reference top-k that is also in the found top-k."""
+    return float(np.mean([
+        len(set(f) & set(r)) / len(r) for f, r in zip(found, reference) if r
+    ]))
+
+
+def recall(found: list[list], relevant: list[set]) -> float:
+    return float(np.mean([len(set(f) & r) / len(r) for f, r in zip(found, relevant) if r]))
+
+
+if __name__ == "__main__":
+    db_name = "legal_corpus"
+    limit = 10
+    batch_size = 64
+
+    store = EmbeddingStore(r"d:\Work\VLSP\Dataset\legal_corpus_embedded_combined")
+    queries = json.loads(Path(r"d:\Work\VLSP\Dataset\train.json").read_text(encoding="utf-8"))
+    relevant = [set(item["relevant_laws"]) for item in queries]
+
+    # Full-size query embeddings once; each variant truncates them the same way as the corpus
+    jina = Jina(cache=EmbeddingCache(r"d:\Work\VLSP\Dataset\embedding_cache.sqlite"))
+    query_vectors = jina.embed_by_batch([item["question"] for item in queries], batch_size=64)
+    jina.close()
+
+    qdrant = Qdrant()
+    report = []
+    baseline = None
+    for variant in VARIANTS:
+        build(qdrant, store, db_name, variant)
+        dim = variant.get("dimensions") or store.dim
+        vectors = [vector[:dim] for vector in query_vectors]
+        name = collection_name(db_name, variant)
+        search(qdrant, name, vectors[:batch_size], variant, limit, batch_size)  # warm up
+        aids, latencies = search(qdrant, name, vectors, variant, limit, batch_size)
+        if baseline is None:
+            baseline = aids
+        row = {
+            "variant": variant["name"],
+            "dimensions": dim,
+            "quantization": variant.get("quantization"),
+            "ram_mb": ram_bytes(len(store), dim, variant) / 2**20,
+            "p50_ms": float(np.percentile(latencies, 50)),
+            "p95_ms": float(np.percentile(latencies, 95)),
+            f"overlap@{limit}_vs_full": overlap(aids, baseline),
+            f"recall@{limit}": recall(aids, relevant),
+        }
+        report.append(row)
+        print(
+            f"{row['variant']:>12} | {dim:>4} dims | {row['ram_mb']:8.1f} MB | "
+            f"p50 {row['p50_ms']:6.2f} ms | p95 {row['p95_ms']:6.2f} ms | "
+            f"overlap {row[f'overlap@{limit}_vs_full']:.3f} | recall@{limit} {row[f'recall@{limit}']:.3f}"
+        )
+
+    output_path = Path(r"d:\Work\VLSP\Dataset\compression_report.json")
+    output_path.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"\nReport saved to: {output_path}")
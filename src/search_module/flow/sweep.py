@@ -0,0 +1,55 @@
+import json
+import time
+from pathlib import Path
+
+from ..cache import EmbeddingCache, RerankCache
+from ..jina_client import Jina
+from ..replay import Recording, grid, record, sweep
+from ..searcher import HybridSearcher
+
+if __name__ == "__main__":
+    data_path = r"d:\Work\VLSP\Dataset\train.json"
+    recording_path = Path(r"d:\Work\VLSP\Dataset\train_recording")
+
+    # --- Record once: both legs 30 deep, every candidate reranked ---
+    if not (recording_path / "queries.json").exists():
+        queries_data = json.loads(Path(data_path).read_text(encoding="utf-8"))
+        queries = [{"qid": item["qid"], "question": item["question"]} for item in queries_data]
+        searcher = HybridSearcher(
+            db_name="legal_corpus",
+            jina=Jina(
+                cache=EmbeddingCache(r"d:\Work\VLSP\Dataset\embedding_cache.sqlite"),
+                rerank_cache=RerankCache(r"d:\Work\VLSP\Dataset\rerank_cache.sqlite"),
+            ),
+        )
+        record(searcher, queries, recording_path, depth=30)
+        searcher.close()
+    print(f"Recording: {len(Recording.load(recording_path))} questions")
+
+    # --- Replay: no network calls, one process per core ---
+    fusions = [None] + [
+        {"method": "rrf", "dense_depth": dense_depth, "lexical_depth": lexical_depth}
+        for dense_depth in (3, 5, 10) for lexical_depth in (5, 10, 20)
+    ] + [
+        {"method": "weighted", "dense_depth": 10, "lexical_depth": 10, "weights": (1.0, w)}
+        for w in (0.5, 1.0, 2.0)
+    ]
+    configs = grid(
+        qdrant_limit=[3, 5, 10, 30],
+        elastic_size=[5, 10, 20, 30],
+        top_n=[1, 2, 3, 5],
+        fusion=fusions,
+        gate=[None, {"agree_depth": 2, "shrink_to": 5}],
+    )
+    # A gate only applies on top of fusion
+    configs = [config for config in configs if config["gate"] is None or config["fusion"] is not None]
+    start_time = time.perf_counter()
+    scored = sweep(recording_path, data_path, configs)
+    print(f"Scored {len(scored)} configs in {time.perf_counter() - start_time:.1f}s")
+
+    for row in scored[:10]:
+        print(f"F2 {row['f2']:.4f} | P {row['precision']:.4f} | R {row['recall']:.4f} | {row['config']}")
+
+    output_path = Path(r"d:\Work\VLSP\Dataset\sweep_results.json")
+    output_path.write_text(json.dumps(scored, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"\nResults saved to: {output_path}")
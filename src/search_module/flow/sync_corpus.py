@@ -0,0 +1,41 @@
+import json
+from pathlib import Path
+
+from data_process_module.corpus_transform import flatten
+
+from ..cache import EmbeddingCache
+from ..db.elastic import Elastic
+from ..db.qdrant import Qdrant
+from ..embedding_store import EmbeddingStore
+from ..jina_client import Jina
+from ..sync import Manifest, sync
+
+if __name__ == "__main__":
+    corpus_data = json.loads(Path(r"d:\Work\VLSP\Dataset\legal_corpus.json").read_text(encoding="utf-8"))
+    flattened_data = flatten(corpus_data)
+
+    db_name = "legal_corpus"
+    manifest_path = Path(r"d:\Work\VLSP\Dataset\legal_corpus_manifest.json")
+    store_path = Path(r"d:\Work\VLSP\Dataset\legal_corpus_embedded_combined")
+    text_store_path = Path(r"d:\Work\VLSP\Dataset\legal_corpus_text.bin")
+
+    if manifest_path.exists():
+        manifest = Manifest(manifest_path)
+    elif store_path.exists():
+        # First sync after a full upload_to_db: everything in the store is already indexed
+        manifest = Manifest.from_store(manifest_path, EmbeddingStore(store_path))
+        manifest.save()
+    else:
+        manifest = Manifest(manifest_path)
+
+    stats = sync(
+        flattened_data,
+        manifest,
+        Jina(cache=EmbeddingCache(r"d:\Work\VLSP\Dataset\embedding_cache.sqlite")),
+        Qdrant(),
+        Elastic(),
+        db_name,
+        store=EmbeddingStore(store_path, mode="a") if store_path.exists() else None,
+        text_store_path=text_store_path,
+    )
+    print(f"Sync done: {stats['upserted']} upserted, {stats['deleted']} deleted.")
@@ -1,36 +1,33 @@
-import json
-from pathlib import Path
-
-from data_process_module.corpus_transform import flatten
-
 from ..db.elastic import Elastic
 from ..db.qdrant import Qdrant
-from ..jina_client import Jina
-
-embedded_corpus_data = json.loads(Path(r"d:\Work\VLSP\Dataset\legal_corpus_embedded_combined.json").read_text(encoding="utf-8"))
-normal_corpus_data = json.loads(Path(r"d:\Work\VLSP\Dataset\legal_corpus.json").read_text(encoding="utf-8"))
-flattened_data = flatten(normal_corpus_data)
-
-qdrant = Qdrant()
-elastic = Elastic()
-jina = Jina()
-
-db_name = "legal_corpus"
-
-batch_size = 32
-total = len(embedded_corpus_data)
-print(f"Total items to upload: {total}")
-
-for start in range(0, total, batch_size):
-    end = min(start + batch_size, total)
-    batch = embedded_corpus_data[start:end]
-
-    qdrant.bulk_upload(db_name, batch)
-    print(f"Qdrant upload done for items {start} to {end-1}.")
-
-for start in range(0, total, batch_size):
-    end = min(start + batch_size, total)
-    batch = normal_corpus_data[start:end]
-
-    elastic.bulk_upload(db_name, batch)
-    print(f"Elastic upload done for items {start} to {end-1}.")
\ No newline at end of file
+from ..embedding_store import EmbeddingStore
+from ..ingest import ingest, store_datapoints
+
+if __name__ == "__main__":
+    # Memory-mapped: only the batches in flight are materialized
+    store = EmbeddingStore(r"d:\Work\VLSP\Dataset\legal_corpus_embedded_combined")
+
+    qdrant = Qdrant()
+    elastic = Elastic()
+
+    db_name = "legal_corpus"
+    qdrant.init_collection(db_name, embedding_size=store.dim)
+    elastic.init_index(db_name)
+
+    batch_size = 256
+    print(f"Total items to upload: {len(store)}")
+
+    stats = ingest(
+        store_datapoints(store, batch_size),
+        qdrant,
+        elastic,
+        db_name,
+        qdrant_parallel=4,
+        qdrant_method="spawn",  # fresh workers, not forks of this threaded process
+        elastic_threads=4,
+        zero_replicas=True,  # restored once the load finishes
+    )
+    print(
+        f"Uploaded {stats['datapoints']} items in {stats['seconds']:.1f}s "
+        f"(ES indexed {stats['elastic_indexed']}, failed {stats['elastic_failed']})."
+    )
@@ -0,0 +1,123 @@
+import threading
+
+
+def _normalize(scores: list[float], method: str) -> list[float]:
+    if not scores:
+        return []
+    if method == "max":
+        top = max(scores)
+        return [s / top if top else 0.0 for s in scores]
+    low, high = min(scores), max(scores)
+    if high == low:
+        return [1.0] * len(scores)
+    return [(s - low) / (high - low) for s in scores]
+
+
+def reciprocal_rank_fusion(
+    legs: list[list[dict]], weights: list[float] | None = None, k: int = 60
+) -> list[dict]:
+    """score(aid) = sum over legs of weight / (k + rank); rank starts at 1."""
+    weights = weights or [1.0] * len(legs)
+    fused: dict = {}
+    for leg, weight in zip(legs, weights):
+        for rank, item in enumerate(leg, start=1):
+            aid = item.get("aid")
+            if not aid:
+                continue
+            entry = fused.setdefault(aid, item | {"fused_score": 0.0})
+            entry["fused_score"] += weight / (k + rank)
+    return sorted(fused.values(), key=lambda item: -item["fused_score"])
+
+
+def weighted_score_fusion(
+    legs: list[list[dict]], weights: list[float] | None = None, normalization: str = "minmax"
+) -> list[dict]:
+    """score(aid) = sum over legs of weight * normalized leg score ("minmax" or "max")."""
+    weights = weights or [1.0] * len(legs)
+    fused: dict = {}
+    for leg, weight in zip(legs, weights):
+        normalized = _normalize([item.get("score") or 0.0 for item in leg], normalization)
+        for item, score in zip(leg, normalized):
+            aid = item.get("aid")
+            if not aid:
+                continue
+            entry = fused.setdefault(aid, item | {"fused_score": 0.0})
+            entry["fused_score"] += weight * score
+    return sorted(fused.values(), key=lambda item: -item["fused_score"])
+
+
+class Fusion:
+    """Fuses the dense and lexical hit lists into one ranked candidate list.
+
+    `method` is "rrf" or "weighted". Each leg is cut to its own depth before
+    fusing, and the fused list to `candidate_depth` (None keeps all).
+    """
+
+    def __init__(
+        self,
+        method: str = "rrf",
+        dense_depth: int = 10,
+        lexical_depth: int = 10,
+        weights: tuple[float, float] = (1.0, 1.0),
+        rrf_k: int = 60,
+        normalization: str = "minmax",
+        candidate_depth: int | None = None,
+    ) -> None:
+        if method not in ("rrf", "weighted"):
+            raise ValueError(f"unknown fusion method: {method}")
+        self.method = method
+        self.dense_depth = dense_depth
+        self.lexical_depth = lexical_depth
+        self.weights = list(weights)
+        self.rrf_k = rrf_k
+        self.normalization = normalization
+        self.candidate_depth = candidate_depth
+
+    def fuse(self, dense: list[dict], lexical: list[dict]) -> list[dict]:
+        legs = [dense[:self.dense_depth], lexical[:self.lexical_depth]]
+        if self.method == "rrf":
+            fused = reciprocal_rank_fusion(legs, self.weights, self.rrf_k)
+        else:
+            fused = weighted_score_fusion(legs, self.weights, self.normalization)
+        return fused[:self.candidate_depth] if self.candidate_depth else fused
+
+
+class RerankGate:
+    """Decides how much of the fused list to send to the reranker.
+
+    - "skip": both legs rank the same `agree_depth` aids on top (in any
+      order). The fused order is returned as is and no rerank call is made.
+    - "shrink": the legs at least share their top hit. Only the first
+      `shrink_to` fused candidates are reranked.
+    - "full": otherwise, every candidate is reranked.
+
+    Thread-safe counters record how often each decision is taken.
+    """
+
+    def __init__(self, agree_depth: int = 2, shrink_to: int | None = 5) -> None:
+        self.agree_depth = agree_depth
+        self.shrink_to = shrink_to
+        self.counts = {"skip": 0, "shrink": 0, "full": 0}
+        self._lock = threading.Lock()
+
+    def decide(self, dense: list[dict], lexical: list[dict]) -> str:
+        dense_top = [item.get("aid") for item in dense[:self.agree_depth]]
+        lexical_top = [item.get("aid") for item in lexical[:self.agree_depth]]
+        if len(dense_top) == self.agree_depth and set(dense_top) == set(lexical_top):
+            decision = "skip"
+        elif self.shrink_to and dense_top and lexical_top and dense_top[0] == lexical_top[0]:
+            decision = "shrink"
+        else:
+            decision = "full"
+        with self._lock:
+            self.counts[decision] += 1
+        return decision
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = sum(self.counts.values())
+            return self.counts | {
+                "total": total,
+                "skip_rate": self.counts["skip"] / total if total else 0.0,
+                "shrink_rate": self.counts["shrink"] / total if total else 0.0,
+            }
@@ -0,0 +1,47 @@
+import numpy as np
+
+from .jina_client import RankItem
+
+
+def to_result_item(source: dict) -> dict:
+    """Keep the fields the search flow passes around from a Qdrant payload or ES `_source`."""
+    return {
+        "doc_id": source.get("doc_id"),
+        "law_id": source.get("law_id"),
+        "aid": source.get("aid"),
+        "content_Article": source.get("content_Article"),
+        "score": source.get("score"),
+    }
+
+
+def scope_kwargs(law_ids=None, doc_ids=None) -> dict:
+    """`search_batch` filter kwargs for a scoped search; empty when unscoped."""
+    scope = {}
+    if law_ids is not None:
+        scope["law_ids"] = list(law_ids)
+    if doc_ids is not None:
+        scope["doc_ids"] = list(doc_ids)
+    return scope
+
+
+def merge_by_aid(*hit_lists: list[dict]) -> list[dict]:
+    """Deduplicate hits from several legs by aid; later legs win on conflicts."""
+    return list({item["aid"]: item for hits in hit_lists for item in hits if item.get("aid")}.values())
+
+
+def apply_rerank(results_list: list[dict], rerank_results: list[RankItem]) -> list[dict]:
+    return [
+        results_list[int(item["index"])] | {"relevance_score": item["relevance_score"]}
+        for item in rerank_results
+    ]
+
+
+def scope_mask(law_id_values: np.ndarray, doc_id_values: np.ndarray, law_ids=None, doc_ids=None) -> np.ndarray:
+    """Boolean mask of the documents inside a scope, for the local backends;
+    matches exactly like the Qdrant and ES filters."""
+    mask = np.ones(len(law_id_values), dtype=bool)
+    if law_ids is not None:
+        mask &= np.isin(law_id_values, np.asarray(list(law_ids), dtype=object))
+    if doc_ids is not None:
+        mask &= np.isin(doc_id_values, np.asarray(list(doc_ids), dtype=np.int64))
+    return mask
@@ -0,0 +1,115 @@
+import queue
+import threading
+import time
+from typing import Callable, Iterable, Iterator
+
+from .db.elastic import Elastic
+from .db.qdrant import Qdrant
+from .embedding_store import EmbeddingStore
+
+_DONE = object()
+
+
+def store_datapoints(store: EmbeddingStore, batch_size: int = 256) -> Iterator[list[dict]]:
+    """Lazily yield batches of datapoints (metadata + embedding) from an embedding store."""
+    for metadata, vectors in store.iter_batches(batch_size):
+        yield [m | {"embedding": v.tolist()} for m, v in zip(metadata, vectors)]
+
+
+def _drain(q: queue.Queue) -> Iterator[dict]:
+    while True:
+        batch = q.get()
+        if batch is _DONE:
+            return
+        yield from batch
+
+
+def ingest(
+    batches: Iterable[list[dict]],
+    qdrant: Qdrant,
+    elastic: Elastic,
+    db_name: str,
+    qdrant_parallel: int = 1,
+    elastic_threads: int = 4,
+    zero_replicas: bool = True,
+    queue_size: int = 8,
+    dimensions: int | None = None,
+    qdrant_method: str | None = None,
+) -> dict:
+    """Upload datapoint batches into Qdrant and Elasticsearch concurrently in one pass.
+
+    The input is read once and fanned out into two bounded queues, one per
+    store, so memory stays at a few batches regardless of corpus size. Qdrant
+    gets parallel `upload_points` with `wait=False`; ES gets `parallel_bulk`
+    inside `bulk_load_mode` (no refresh, optionally no replicas, restored at
+    the end). `dimensions` truncates the vectors sent to Qdrant.
+
+    `qdrant_parallel` > 1 uploads from a multiprocessing pool started with
+    `qdrant_method` (see `Qdrant.upload_stream`). On Windows and macOS the
+    default is spawn, which re-imports the calling script, so guard it with
+    `if __name__ == "__main__":`. On Linux the default forks this process
+    while the ES and queue threads run; prefer "spawn" there too.
+
+    Once ES is refreshed and Qdrant has applied every point, the corpus
+    version is bumped, so cached search results are dropped only when the
+    new data is searchable in both stores.
+    """
+    queues = {"qdrant": queue.Queue(maxsize=queue_size), "elastic": queue.Queue(maxsize=queue_size)}
+    failed = threading.Event()
+    errors: dict[str, BaseException] = {}
+    stats = {"datapoints": 0, "qdrant_sent": 0, "elastic_indexed": 0, "elastic_failed": 0}
+
+    def upload_qdrant(points: Iterator[dict]) -> None:
+        stats["qdrant_sent"] = qdrant.upload_stream(
+            db_name, points, parallel=qdrant_parallel, dimensions=dimensions, method=qdrant_method
+        )
+
+    def upload_elastic(points: Iterator[dict]) -> None:
+        with elastic.bulk_load_mode(db_name, zero_replicas=zero_replicas):
+            indexed, failures = elastic.parallel_bulk_upload(db_name, points, thread_count=elastic_threads)
+        stats["elastic_indexed"] = indexed
+        stats["elastic_failed"] = failures
+
+    def consume(name: str, upload: Callable[[Iterator[dict]], None]) -> None:
+        try:
+            upload(_drain(queues[name]))
+        except BaseException as e:
+            errors[name] = e
+            failed.set()
+
+    workers = [
+        threading.Thread(target=consume, args=("qdrant", upload_qdrant), daemon=True),
+        threading.Thread(target=consume, args=("elastic", upload_elastic), daemon=True),
+    ]
+    for worker in workers:
+        worker.start()
+
+    def put(name: str, item) -> bool:
+        # Time out now and then so a dead consumer cannot block the producer forever
+        while name not in errors:
+            try:
+                queues[name].put(item, timeout=1.0)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    start_time = time.perf_counter()
+    for batch in batches:
+        if failed.is_set():
+            break
+        for name in queues:
+            put(name, batch)
+        stats["datapoints"] += len(batch)
+        print(f"Queued {stats['datapoints']} datapoints ({stats['datapoints'] / (time.perf_counter() - start_time):.0f}/s)")
+    for name in queues:
+        put(name, _DONE)
+    for worker in workers:
+        worker.join()
+    if errors:
+        name, error = next(iter(errors.items()))
+        raise RuntimeError(f"{name} ingestion failed") from error
+    qdrant.wait_applied(db_name, stats["qdrant_sent"])
+    elastic.bump_corpus_version(db_name)
+    stats["seconds"] = time.perf_counter() - start_time
+    return stats
@@ -1,76 +1,440 @@
+import asyncio
 import json
 import os
 import urllib.parse
 from typing import TypedDict
 
+import httpx
 import requests
 from dotenv import load_dotenv
-from more_itertools import chunked
+from requests.adapters import HTTPAdapter
+
+from .cache import EmbeddingCache, RerankCache
+from .metrics import REGISTRY
 
 load_dotenv()
 
+EMBED_MODEL = "jina-embeddings-v3"
+RERANK_MODEL = "jina-reranker-v2-base-multilingual"
+
+# Tokens each model reads per input (embeddings) and per query+document pair (rerank); the rest is truncated
+EMBED_MAX_TOKENS = 8192
+RERANK_MAX_TOKENS = 1024
+# UTF-8 bytes per token of Vietnamese legal text, rounded down so estimates err high
+BYTES_PER_TOKEN = 3
+
 
 class RankItem(TypedDict):
     index: str
     relevance_score: float
 
 
+class JinaError(Exception):
+    """Non-200 response from the Jina API."""
+
+    def __init__(self, status_code: int, message: str, retry_after: float | None = None) -> None:
+        super().__init__(f"HTTP {status_code}: {message}")
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self) -> bool:
+        return self.status_code == 429 or self.status_code >= 500
+
+
+def _check_response(status_code: int, headers, text: str) -> None:
+    if status_code == 200:
+        return
+    retry_after = headers.get("Retry-After")
+    try:
+        retry_after = float(retry_after) if retry_after is not None else None
+    except ValueError:
+        retry_after = None
+    raise JinaError(status_code, text[:500], retry_after)
+
+
+def _headers(api_key: str | None) -> dict:
+    return {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {api_key}",
+    }
+
+
+def pack_batches(
+    text_list: list[str],
+    max_items: int | None,
+    max_text_tokens: int,
+    token_budget: int,
+    byte_budget: int,
+    sort: bool = True,
+) -> list[list[int]]:
+    """Group text positions into batches under an item, token and byte budget.
+
+    Tokens are estimated from the UTF-8 length and capped at what the model
+    reads per text. The whole text still goes on the wire, so it counts in
+    full against the byte budget. With `sort`, the longest texts are packed
+    first, so each batch holds texts of similar length. Otherwise input
+    order is kept. A text over budget on its own gets a batch to itself.
+    """
+    sizes = [len(text.encode("utf-8")) for text in text_list]
+    tokens = [min(max_text_tokens, size // BYTES_PER_TOKEN + 1) for size in sizes]
+    order = sorted(range(len(text_list)), key=lambda i: -tokens[i]) if sort else range(len(text_list))
+    batches: list[list[int]] = []
+    batch: list[int] = []
+    batch_tokens = batch_bytes = 0
+    for i in order:
+        full = max_items is not None and len(batch) >= max_items
+        if batch and (full or batch_tokens + tokens[i] > token_budget or batch_bytes + sizes[i] > byte_budget):
+            batches.append(batch)
+            batch, batch_tokens, batch_bytes = [], 0, 0
+        batch.append(i)
+        batch_tokens += tokens[i]
+        batch_bytes += sizes[i]
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def _unpack_embeddings(
+    size: int, batches: list[list[int]], results: list[list[list[float]]]
+) -> list[list[float]]:
+    """Put the embeddings of packed batches back in input order; raises if a batch came back short."""
+    embeddings: list[list[float] | None] = [None] * size
+    for batch, batch_embeddings in zip(batches, results):
+        if len(batch_embeddings) != len(batch):
+            raise ValueError(f"got {len(batch_embeddings)} embeddings for {len(batch)} texts")
+        for i, embedding in zip(batch, batch_embeddings):
+            embeddings[i] = embedding
+    return embeddings
+
+
+def _embed_data(text_list: list[str], task: str, dimensions: int | None = None) -> dict:
+    data = {
+        "model": EMBED_MODEL,
+        "truncate": True,
+        "input": text_list,
+    }
+    if task:
+        data["task"] = task
+    if dimensions:
+        # Matryoshka truncation: the API keeps the leading dimensions
+        data["dimensions"] = dimensions
+    return data
+
+
+def _embed_cache_model(dimensions: int | None) -> str:
+    return f"{EMBED_MODEL}@{dimensions}" if dimensions else EMBED_MODEL
+
+
+def _rerank_data(query: str, text_list: list[str], top_n: int) -> dict:
+    return {
+        "model": RERANK_MODEL,
+        "query": query,
+        "documents": text_list,
+        "top_n": top_n,
+        "return_documents": False,
+    }
+
+
+def _parse_embeddings(body: dict) -> list[list[float]]:
+    embedding_list = []
+    for i in body.get("data", []):
+        embedding_list.append(i.get("embedding", []))
+    return embedding_list
+
+
+def _cache_lookup(
+    cache: EmbeddingCache, text_list: list[str], task: str, dimensions: int | None = None
+) -> tuple[list[bytes], list[list[float] | None], dict[bytes, str]]:
+    """Return the cache keys, cached vectors (None on miss) and unique misses."""
+    model = _embed_cache_model(dimensions)
+    keys = [EmbeddingCache.key(model, task, text) for text in text_list]
+    found = cache.get_many(keys)
+    misses: dict[bytes, str] = {}
+    for key, text, vector in zip(keys, text_list, found):
+        if vector is None:
+            misses.setdefault(key, text)
+    return keys, found, misses
+
+
+def _cache_fill(
+    cache: EmbeddingCache,
+    keys: list[bytes],
+    found: list[list[float] | None],
+    miss_keys: list[bytes],
+    miss_embeddings: list[list[float]],
+) -> list[list[float]]:
+    if len(miss_embeddings) != len(miss_keys):
+        raise ValueError(f"got {len(miss_embeddings)} embeddings for {len(miss_keys)} texts")
+    fresh = dict(zip(miss_keys, miss_embeddings))
+    cache.put_many(list(fresh.items()))
+    return [vector if vector is not None else fresh[key] for key, vector in zip(keys, found)]
+
+
+def _parse_ranks(body: dict) -> list[RankItem]:
+    rank_list = []
+    for i in body.get("results", []):
+        rank_list.append(i)
+    return rank_list
+
+
+def _merge_ranks(batches: list[list[int]], results: list[list[RankItem]], top_n: int) -> list[RankItem]:
+    """Merge the ranks of packed rerank batches into one top_n over the input positions.
+
+    Scores are per query+document pair, so they compare across batches.
+    """
+    ranks = [
+        {"index": batch[int(item["index"])], "relevance_score": item["relevance_score"]}
+        for batch, batch_ranks in zip(batches, results)
+        for item in batch_ranks
+    ]
+    return sorted(ranks, key=lambda item: -item["relevance_score"])[:top_n]
+
+
+def _rerank_lookup(
+    cache: RerankCache, query: str, doc_ids: list, text_list: list[str]
+) -> tuple[list[bytes], list[float | None], list[int]]:
+    """Return the cache keys, cached scores (None on miss) and positions to send."""
+    keys = [RerankCache.key(RERANK_MODEL, query, doc_id, text) for doc_id, text in zip(doc_ids, text_list)]
+    found = cache.get_many(keys)
+    return keys, found, [i for i, score in enumerate(found) if score is None]
+
+
+def _rerank_merge(
+    cache: RerankCache,
+    keys: list[bytes],
+    found: list[float | None],
+    miss_positions: list[int],
+    fresh: list[RankItem],
+    top_n: int,
+) -> list[RankItem]:
+    scores = list(found)
+    for item in fresh:
+        scores[miss_positions[int(item["index"])]] = item["relevance_score"]
+    cache.put_many([(keys[i], scores[i]) for i in miss_positions if scores[i] is not None])
+    ranked = sorted((i for i, score in enumerate(scores) if score is not None), key=lambda i: -scores[i])
+    return [{"index": i, "relevance_score": scores[i]} for i in ranked[:top_n]]
+
+
 class Jina:
-    def __init__(self) -> None:
+    """Jina API client over a keep-alive connection pool.
+
+    `pool_size` caps the number of sockets kept open to the endpoint, so it
+    should be at least the number of threads sharing the client. `timeout` is
+    passed to requests as is: a float or a (connect, read) tuple in seconds.
+    With a `cache`, `embed_by_batch` only sends texts it has not seen before;
+    with a `rerank_cache`, `rerank` only scores documents (by `doc_ids` and
+    text) it has not scored for the same normalized query before. `dimensions` asks
+    for Matryoshka-truncated embeddings; it must match the collection size.
+
+    Embedding inputs and rerank documents are packed into requests of at most
+    `token_budget` estimated tokens and `byte_budget` bytes of text (see
+    `pack_batches`); results come back in input order.
+    """
+
+    def __init__(
+        self,
+        pool_size: int = 16,
+        timeout: float | tuple[float, float] = (5.0, 60.0),
+        cache: EmbeddingCache | None = None,
+        rerank_cache: RerankCache | None = None,
+        dimensions: int | None = None,
+        token_budget: int = 32768,
+        byte_budget: int = 1 << 20,
+    ) -> None:
         self.endpoint = os.getenv("JINA_ENDPOINT", "https://api.jina.ai/v1/")
         self.api_key = os.getenv("JINA_API_KEY", None)
+        self.timeout = timeout
+        self.dimensions = dimensions
+        self.token_budget = token_budget
+        self.byte_budget = byte_budget
+        self.cache = cache
+        self.rerank_cache = rerank_cache
+        self.session = requests.Session()
+        self.session.headers.update(_headers(self.api_key))
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def close(self) -> None:
+        self.session.close()
+
+    def __enter__(self) -> "Jina":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _post(self, path: str, data: dict) -> dict:
+        url = urllib.parse.urljoin(self.endpoint, path)
+        # Raw UTF-8 instead of \u escapes: Vietnamese text is about half the bytes
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        with REGISTRY.timer(f"jina.{path}") as span:
+            span["sent"] = len(body)
+            response = self.session.post(url, data=body, timeout=self.timeout)
+            span["received"] = len(response.content)
+            _check_response(response.status_code, response.headers, response.text)
+            return response.json()
 
     def embed(self, text_list: list[str], task: str = "") -> list[list[float]]:
         """https://huggingface.co/jinaai/jina-embeddings-v3"""
-        url = urllib.parse.urljoin(self.endpoint, "embeddings")
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.api_key}",
-        }
-        data = {
-            "model": "jina-embeddings-v3",
-            "truncate": True,
-            "input": text_list,
-        }
-        if task:
-            data["task"] = task
-        response = requests.post(url, headers=headers, data=json.dumps(data))
-
-        embedding_list = []
-        for i in response.json().get("data", []):
-            embedding_list.append(i.get("embedding", []))
-        return embedding_list
+        return _parse_embeddings(self._post("embeddings", _embed_data(text_list, task, self.dimensions)))
+
+    def embed_with_usage(
+        self, text_list: list[str], task: str = ""
+    ) -> tuple[list[list[float]], int]:
+        """Like `embed`, also returning the tokens billed for the call.
+
+        With a `cache`, only the texts it has not seen are sent (and billed).
+        """
+        if self.cache is None:
+            body = self._post("embeddings", _embed_data(text_list, task, self.dimensions))
+            return _parse_embeddings(body), body.get("usage", {}).get("total_tokens", 0)
+        keys, found, misses = _cache_lookup(self.cache, text_list, task, self.dimensions)
+        miss_embeddings, tokens = [], 0
+        if misses:
+            body = self._post("embeddings", _embed_data(list(misses.values()), task, self.dimensions))
+            miss_embeddings, tokens = _parse_embeddings(body), body.get("usage", {}).get("total_tokens", 0)
+        return _cache_fill(self.cache, keys, found, list(misses), miss_embeddings), tokens
 
     def embed_by_batch(
         self, text_list: list[str], task: str = "", batch_size: int = 8
     ) -> list[list[float]]:
-        """Embed text in batches to avoid large payloads."""
-        embedding_list = []
-        for batch in chunked(text_list, batch_size):
-            embedding_list.extend(self.embed(batch, task))
-        return embedding_list
+        """Embed text in length-packed batches of at most `batch_size` texts."""
+        if self.cache is None:
+            return self._embed_chunks(text_list, task, batch_size)
+        keys, found, misses = _cache_lookup(self.cache, text_list, task, self.dimensions)
+        miss_embeddings = self._embed_chunks(list(misses.values()), task, batch_size)
+        return _cache_fill(self.cache, keys, found, list(misses), miss_embeddings)
+
+    def _embed_chunks(
+        self, text_list: list[str], task: str, batch_size: int
+    ) -> list[list[float]]:
+        batches = pack_batches(text_list, batch_size, EMBED_MAX_TOKENS, self.token_budget, self.byte_budget)
+        results = [self.embed([text_list[i] for i in batch], task) for batch in batches]
+        return _unpack_embeddings(len(text_list), batches, results)
 
     def rerank(
-        self, query: str, text_list: list[str], top_n: int = 3
+        self, query: str, text_list: list[str], top_n: int = 3, doc_ids: list | None = None
     ) -> list[RankItem]:
         """https://huggingface.co/jinaai/jina-reranker-v2-base-multilingual"""
-        url = urllib.parse.urljoin(self.endpoint, "rerank")
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.api_key}",
-        }
-        data = {
-            "model": "jina-reranker-v2-base-multilingual",
-            "query": query,
-            "documents": text_list,
-            "top_n": top_n,
-            "return_documents": False,
-        }
-        response = requests.post(url, headers=headers, data=json.dumps(data))
-        rank_list = []
-        for i in response.json().get("results", []):
-            rank_list.append(i)
-        return rank_list
+        if self.rerank_cache is None or doc_ids is None:
+            return self._rerank_packed(query, text_list, top_n)
+        keys, found, miss_positions = _rerank_lookup(self.rerank_cache, query, doc_ids, text_list)
+        fresh = []
+        if miss_positions:
+            misses = [text_list[i] for i in miss_positions]
+            fresh = self._rerank_packed(query, misses, len(misses))
+        return _rerank_merge(self.rerank_cache, keys, found, miss_positions, fresh, top_n)
+
+    def _rerank_packed(self, query: str, text_list: list[str], top_n: int) -> list[RankItem]:
+        batches = pack_batches(text_list, None, RERANK_MAX_TOKENS, self.token_budget, self.byte_budget)
+        if len(batches) == 1:
+            return _parse_ranks(self._post("rerank", _rerank_data(query, text_list, top_n)))
+        # Each batch only needs its own top_n for the merged top_n to be exact
+        results = [
+            self._post("rerank", _rerank_data(query, [text_list[i] for i in batch], min(top_n, len(batch))))
+            for batch in batches
+        ]
+        return _merge_ranks(batches, [_parse_ranks(body) for body in results], top_n)
+
+
+class AsyncJina:
+    """asyncio counterpart of `Jina` with the same embed/rerank API.
+
+    Requests share one pooled `httpx.AsyncClient`; at most `pool_size` are on
+    the wire at once and the rest wait for a free connection, so hundreds of
+    coroutines can await the client without a thread each.
+    """
+
+    def __init__(
+        self,
+        pool_size: int = 64,
+        timeout: float = 60.0,
+        cache: EmbeddingCache | None = None,
+        rerank_cache: RerankCache | None = None,
+        dimensions: int | None = None,
+        token_budget: int = 32768,
+        byte_budget: int = 1 << 20,
+    ) -> None:
+        self.endpoint = os.getenv("JINA_ENDPOINT", "https://api.jina.ai/v1/")
+        self.api_key = os.getenv("JINA_API_KEY", None)
+        self.dimensions = dimensions
+        self.token_budget = token_budget
+        self.byte_budget = byte_budget
+        self.cache = cache
+        self.rerank_cache = rerank_cache
+        self.client = httpx.AsyncClient(
+            headers=_headers(self.api_key),
+            limits=httpx.Limits(
+                max_connections=pool_size, max_keepalive_connections=pool_size
+            ),
+            timeout=httpx.Timeout(timeout, connect=5.0, pool=None),
+        )
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+    async def __aenter__(self) -> "AsyncJina":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+    async def _post(self, path: str, data: dict) -> dict:
+        url = urllib.parse.urljoin(self.endpoint, path)
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        with REGISTRY.timer(f"jina.{path}") as span:
+            span["sent"] = len(body)
+            response = await self.client.post(url, content=body)
+            span["received"] = len(response.content)
+            _check_response(response.status_code, response.headers, response.text)
+            return response.json()
+
+    async def embed(self, text_list: list[str], task: str = "") -> list[list[float]]:
+        """https://huggingface.co/jinaai/jina-embeddings-v3"""
+        body = await self._post("embeddings", _embed_data(text_list, task, self.dimensions))
+        return _parse_embeddings(body)
+
+    async def embed_by_batch(
+        self, text_list: list[str], task: str = "", batch_size: int = 8
+    ) -> list[list[float]]:
+        """Embed text in length-packed batches, all batches in flight concurrently."""
+        if self.cache is None:
+            return await self._embed_chunks(text_list, task, batch_size)
+        keys, found, misses = _cache_lookup(self.cache, text_list, task, self.dimensions)
+        miss_embeddings = await self._embed_chunks(list(misses.values()), task, batch_size)
+        return _cache_fill(self.cache, keys, found, list(misses), miss_embeddings)
+
+    async def _embed_chunks(
+        self, text_list: list[str], task: str, batch_size: int
+    ) -> list[list[float]]:
+        batches = pack_batches(text_list, batch_size, EMBED_MAX_TOKENS, self.token_budget, self.byte_budget)
+        results = await asyncio.gather(*(self.embed([text_list[i] for i in batch], task) for batch in batches))
+        return _unpack_embeddings(len(text_list), batches, results)
+
+    async def rerank(
+        self, query: str, text_list: list[str], top_n: int = 3, doc_ids: list | None = None
+    ) -> list[RankItem]:
+        """https://huggingface.co/jinaai/jina-reranker-v2-base-multilingual"""
+        if self.rerank_cache is None or doc_ids is None:
+            return await self._rerank_packed(query, text_list, top_n)
+        keys, found, miss_positions = _rerank_lookup(self.rerank_cache, query, doc_ids, text_list)
+        fresh = []
+        if miss_positions:
+            misses = [text_list[i] for i in miss_positions]
+            fresh = await self._rerank_packed(query, misses, len(misses))
+        return _rerank_merge(self.rerank_cache, keys, found, miss_positions, fresh, top_n)
+
+    async def _rerank_packed(self, query: str, text_list: list[str], top_n: int) -> list[RankItem]:
+        batches = pack_batches(text_list, None, RERANK_MAX_TOKENS, self.token_budget, self.byte_budget)
+        if len(batches) == 1:
+            return _parse_ranks(await self._post("rerank", _rerank_data(query, text_list, top_n)))
+        bodies = await asyncio.gather(*(
+            self._post("rerank", _rerank_data(query, [text_list[i] for i in batch], min(top_n, len(batch))))
+            for batch in batches
+        ))
+        return _merge_ranks(batches, [_parse_ranks(body) for body in bodies], top_n)
 
 
 if __name__ == "__main__":
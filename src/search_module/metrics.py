@@ -0,0 +1,195 @@
+import bisect
+import contextvars
+import itertools
+import json
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+# Upper bounds, Prometheus-style; the last bucket is +Inf
+LATENCY_BUCKETS = tuple(0.00025 * 2 ** (i / 2) for i in range(37))  # 0.25 ms .. ~65 s, x1.41 steps
+SIZE_BUCKETS = tuple(256 * 4**i for i in range(10))  # 256 B .. 64 MiB
+
+_current_trace: contextvars.ContextVar["Trace | None"] = contextvars.ContextVar("trace", default=None)
+_trace_ids = itertools.count(1)
+
+
+class Histogram:
+    """Fixed-bucket histogram; `observe` is a bisect and an increment under a lock."""
+
+    def __init__(self, bounds: tuple[float, ...]) -> None:
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        i = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """Estimate the q-quantile by linear interpolation inside its bucket."""
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if seen + n >= rank and n:
+                lower = self.bounds[i - 1] if i > 0 else 0.0
+                upper = self.bounds[i] if i < len(self.bounds) else self.bounds[-1]
+                return lower + (upper - lower) * (rank - seen) / n
+            seen += n
+        return self.bounds[-1]
+
+
+class Trace:
+    """Spans recorded under one `Metrics.trace` block."""
+
+    def __init__(self, fields: dict, parent: "Trace | None") -> None:
+        self.id = next(_trace_ids)
+        self.parent_id = parent.id if parent is not None else None
+        self.fields = fields
+        self.spans: list[dict] = []
+        self.start = time.perf_counter()
+
+    def record(self, error: str | None) -> dict:
+        record = {"trace_id": self.id, "parent_id": self.parent_id, "ts": time.time()} | self.fields
+        record["ms"] = (time.perf_counter() - self.start) * 1000
+        record["spans"] = self.spans
+        if error is not None:
+            record["error"] = error
+        return record
+
+
+class Metrics:
+    """Per-stage latency and payload-size histograms, error counters and traces.
+
+    `timer(stage)` records the block's duration into `search_stage_seconds`
+    and, if it raises, bumps `search_stage_errors_total`. Setting `sent` or
+    `received` on the yielded span adds a `search_payload_bytes` sample.
+    Inside a `trace` block every span is also appended to that trace, and
+    the trace is written as one JSONL record when a trace file is open.
+    `to_prometheus` renders everything in the Prometheus text format.
+    """
+
+    def __init__(self, trace_path: str | Path | None = None) -> None:
+        self.histograms: dict[tuple[str, tuple], Histogram] = {}
+        self.counters: dict[tuple[str, tuple], float] = {}
+        self.bounds = {"search_stage_seconds": LATENCY_BUCKETS, "search_payload_bytes": SIZE_BUCKETS}
+        self._lock = threading.Lock()
+        self._trace_file = None
+        if trace_path is not None:
+            self.open_trace(trace_path)
+
+    def open_trace(self, path: str | Path) -> None:
+        self.close()
+        self._trace_file = Path(path).open("a", encoding="utf-8")
+
+    def close(self) -> None:
+        if self._trace_file is not None:
+            self._trace_file.close()
+            self._trace_file = None
+
+    def reset(self) -> None:
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+    def histogram(self, name: str, **labels) -> Histogram:
+        key = (name, tuple(sorted(labels.items())))
+        hist = self.histograms.get(key)
+        if hist is None:
+            with self._lock:
+                hist = self.histograms.setdefault(key, Histogram(self.bounds.get(name, LATENCY_BUCKETS)))
+        return hist
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        self.histogram(name, **labels).observe(value)
+
+    def inc(self, name: str, amount: float = 1, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    @contextmanager
+    def timer(self, stage: str) -> Iterator[dict]:
+        span = {"stage": stage}
+        start = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            span["error"] = type(e).__name__
+            self.inc("search_stage_errors_total", stage=stage)
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            self.observe("search_stage_seconds", seconds, stage=stage)
+            for direction in ("sent", "received"):
+                if span.get(direction) is not None:
+                    self.observe("search_payload_bytes", span[direction], stage=stage, direction=direction)
+            trace = _current_trace.get()
+            if trace is not None:
+                span["ms"] = seconds * 1000
+                trace.spans.append(span)
+
+    @contextmanager
+    def trace(self, **fields) -> Iterator[Trace | None]:
+        """Collect the spans of this block into one trace record; a no-op without a trace file."""
+        if self._trace_file is None:
+            yield None
+            return
+        trace = Trace(fields, _current_trace.get())
+        token = _current_trace.set(trace)
+        error = None
+        try:
+            yield trace
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            _current_trace.reset(token)
+            line = json.dumps(trace.record(error), ensure_ascii=False)
+            with self._lock:
+                if self._trace_file is not None:
+                    self._trace_file.write(line + "\n")
+                    self._trace_file.flush()
+
+    def to_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+        typed = set()
+        for (name, labels), hist in histograms:
+            if name not in typed:
+                lines.append(f"# TYPE {name} histogram")
+                typed.add(name)
+            cumulative = 0
+            for bound, n in zip(list(hist.bounds) + ["+Inf"], hist.counts):
+                cumulative += n
+                lines.append(f"{name}_bucket{_labels(labels, le=bound)} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {hist.sum}")
+            lines.append(f"{name}_count{_labels(labels)} {hist.count}")
+        for (name, labels), value in counters:
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter")
+                typed.add(name)
+            lines.append(f"{name}{_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels: tuple, **extra) -> str:
+    pairs = list(labels) + [(k, f"{v:g}" if isinstance(v, float) else v) for k, v in extra.items()]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+# Process-wide registry the clients and the searcher record into
+REGISTRY = Metrics()
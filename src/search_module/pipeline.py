@@ -0,0 +1,169 @@
+import asyncio
+import time
+
+from .db.elastic import DEFAULT_SOURCE_FIELDS, AsyncElastic
+from .db.qdrant import AsyncQdrant
+from .hits import apply_rerank, merge_by_aid, scope_kwargs, to_result_item
+from .jina_client import AsyncJina
+from .metrics import REGISTRY
+from .resilience import DEFAULT_DEADLINES, DeadlineExceeded
+from .text_store import ArticleTextStore
+
+DEFAULT_CONCURRENCY = {"embed": 16, "qdrant": 32, "elastic": 32, "rerank": 8}
+
+
+class StageLimiter:
+    """Bounds how many calls of one stage run at once and, optionally, how
+    many may start per second."""
+
+    def __init__(self, concurrency: int, rate: float | None = None) -> None:
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next_start = 0.0
+        self._lock = asyncio.Lock()
+
+    async def __aenter__(self) -> None:
+        await self.semaphore.acquire()
+        if self.interval:
+            async with self._lock:
+                now = time.monotonic()
+                wait = self._next_start - now
+                self._next_start = max(now, self._next_start) + self.interval
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+    async def __aexit__(self, *exc) -> None:
+        self.semaphore.release()
+
+
+class AsyncHybridPipeline:
+    """Hybrid search on asyncio clients.
+
+    For each query the dense leg (embed -> Qdrant) and the lexical leg (ES)
+    run concurrently, then the merged candidates are reranked. Every stage
+    has its own `StageLimiter`, so throughput is set by the slowest service
+    instead of a fixed worker count. `concurrency` and `rates` override the
+    per-stage defaults by stage name (embed, qdrant, elastic, rerank).
+    With a `text_store`, both legs return ids only and rerank reads the
+    article text locally. A query object with `law_ids` / `doc_ids` is
+    searched within those laws / documents only.
+
+    Each call also gets a deadline per stage (`deadlines` overrides
+    `resilience.DEFAULT_DEADLINES`), so a stalled service degrades one query
+    instead of holding its limiter slot. The deadline starts once the slot
+    is acquired.
+    """
+
+    def __init__(
+        self,
+        jina: AsyncJina,
+        qdrant: AsyncQdrant,
+        elastic: AsyncElastic,
+        db_name: str,
+        concurrency: dict[str, int] | None = None,
+        rates: dict[str, float] | None = None,
+        qdrant_limit: int = 3,
+        elastic_size: int = 10,
+        top_n: int = 3,
+        text_store: ArticleTextStore | None = None,
+        deadlines: dict[str, float] | None = None,
+    ) -> None:
+        self.jina = jina
+        self.qdrant = qdrant
+        self.elastic = elastic
+        self.db_name = db_name
+        self.qdrant_limit = qdrant_limit
+        self.elastic_size = elastic_size
+        self.top_n = top_n
+        self.text_store = text_store
+        concurrency = DEFAULT_CONCURRENCY | (concurrency or {})
+        rates = rates or {}
+        self.limits = {
+            stage: StageLimiter(n, rates.get(stage)) for stage, n in concurrency.items()
+        }
+        self.deadlines = DEFAULT_DEADLINES | (deadlines or {})
+
+    async def _bounded(self, stage: str, awaitable):
+        try:
+            return await asyncio.wait_for(awaitable, self.deadlines[stage])
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded(f"{stage}: no response within {self.deadlines[stage]:.2f}s") from None
+
+    async def dense(self, query: str, scope: dict | None = None) -> list[dict]:
+        async with self.limits["embed"]:
+            with REGISTRY.timer("embed"):
+                vectors = await self._bounded("embed", self.jina.embed_by_batch([query]))
+        async with self.limits["qdrant"]:
+            with REGISTRY.timer("dense"):
+                hits = await self._bounded("qdrant", self.qdrant.search_batch(
+                    self.db_name,
+                    vectors[:1],
+                    limit=self.qdrant_limit,
+                    fields=DEFAULT_SOURCE_FIELDS if self.text_store is not None else None,
+                    **(scope or {}),
+                ))
+        return [to_result_item(hit) for hit in hits[0]]
+
+    async def lexical(self, query: str, scope: dict | None = None) -> list[dict]:
+        fields = DEFAULT_SOURCE_FIELDS
+        if self.text_store is None:
+            fields += ("content_Article",)
+        async with self.limits["elastic"]:
+            with REGISTRY.timer("lexical"):
+                hits = await self._bounded("elastic", self.elastic.search_batch(
+                    self.db_name, [query], size=self.elastic_size, fields=fields, **(scope or {})
+                ))
+        return [to_result_item(hit) for hit in hits[0]]
+
+    async def articles(self, candidates: list[dict]) -> list[str]:
+        """See `HybridSearcher.articles`."""
+        if self.text_store is None:
+            return [item["content_Article"] for item in candidates]
+        texts = [self.text_store.get(item["aid"]) for item in candidates]
+        missing = [item["aid"] for item, text in zip(candidates, texts) if text is None]
+        if missing:
+            fetched = await self.elastic.get_texts(self.db_name, missing)
+            texts = [fetched.get(item["aid"]) if text is None else text for item, text in zip(candidates, texts)]
+            if None in texts:
+                raise KeyError(f"no article text for aids {[a for a in missing if a not in fetched]}")
+        return texts
+
+    async def search(self, query_obj: dict) -> dict:
+        # Each gathered task runs in its own context, so traces do not mix
+        with REGISTRY.trace(qid=query_obj["qid"]):
+            return await self._search(query_obj)
+
+    async def _search(self, query_obj: dict) -> dict:
+        qid = query_obj["qid"]
+        query = query_obj["question"]
+        scope = scope_kwargs(query_obj.get("law_ids"), query_obj.get("doc_ids"))
+        dense, lexical = await asyncio.gather(
+            self.dense(query, scope), self.lexical(query, scope), return_exceptions=True
+        )
+        if isinstance(dense, Exception):
+            print(f"[Qdrant Error] Query {qid}: {dense}")
+            dense = []
+        if isinstance(lexical, Exception):
+            print(f"[Elastic Error] Query {qid}: {lexical}")
+            lexical = []
+
+        results_list = merge_by_aid(dense, lexical)
+        if not results_list:
+            return {"qid": qid, "relevant_laws": []}
+
+        try:
+            articles = await self.articles(results_list)
+            async with self.limits["rerank"]:
+                with REGISTRY.timer("rerank"):
+                    rerank_results = await self._bounded("rerank", self.jina.rerank(
+                        query, articles, top_n=self.top_n, doc_ids=[item["aid"] for item in results_list]
+                    ))
+            reranked_aids = [item.get("aid") for item in apply_rerank(results_list, rerank_results)]
+        except Exception as e:
+            print(f"[Rerank Error] Query {qid}: {e}")
+            reranked_aids = []
+        return {"qid": qid, "relevant_laws": reranked_aids}
+
+    async def run(self, query_objs: list[dict]) -> list[dict]:
+        """Search all queries concurrently; results keep the input order."""
+        return await asyncio.gather(*(self.search(q) for q in query_objs))
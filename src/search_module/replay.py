@@ -0,0 +1,227 @@
+import itertools
+import json
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from .flow.evaluate_results import calculate_metrics
+from .fusion import Fusion, RerankGate
+from .hits import merge_by_aid
+from .searcher import HybridSearcher
+
+LEGS = ("dense", "lexical", "rerank")
+
+
+class Recording:
+    """Per-question candidates of both legs and the rerank score of each one.
+
+    On disk it is a directory of flat arrays: for each of dense, lexical and
+    rerank an `{leg}_aids.npy` (int64), `{leg}_scores.npy` (float32) and
+    `{leg}_offsets.npy` (int64, one more than there are questions), plus
+    `queries.json` with the qids and questions in recording order.
+    """
+
+    def __init__(self, queries: list[dict], arrays: dict[str, np.ndarray]) -> None:
+        self.queries = queries
+        self.arrays = arrays
+
+    def __len__(self) -> int:
+        return len(self.queries)
+
+    @staticmethod
+    def build(queries: list[dict], rows: list[dict[str, list[tuple[int, float]]]]) -> "Recording":
+        arrays = {}
+        for leg in LEGS:
+            pairs = [row[leg] for row in rows]
+            arrays[f"{leg}_aids"] = np.array([aid for p in pairs for aid, _ in p], dtype=np.int64)
+            arrays[f"{leg}_scores"] = np.array([s for p in pairs for _, s in p], dtype=np.float32)
+            arrays[f"{leg}_offsets"] = np.concatenate([[0], np.cumsum([len(p) for p in pairs])]).astype(np.int64)
+        return Recording(queries, arrays)
+
+    def save(self, path: str | Path) -> None:
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        for name, array in self.arrays.items():
+            np.save(path / f"{name}.npy", array)
+        (path / "queries.json").write_text(json.dumps(self.queries, ensure_ascii=False), encoding="utf-8")
+
+    @staticmethod
+    def concat(recordings: list["Recording"]) -> "Recording":
+        arrays = {}
+        for leg in LEGS:
+            aids = [r.arrays[f"{leg}_aids"] for r in recordings]
+            bases = np.cumsum([0] + [len(a) for a in aids])
+            arrays[f"{leg}_aids"] = np.concatenate([np.empty(0, dtype=np.int64)] + aids)
+            arrays[f"{leg}_scores"] = np.concatenate(
+                [np.empty(0, dtype=np.float32)] + [r.arrays[f"{leg}_scores"] for r in recordings]
+            )
+            arrays[f"{leg}_offsets"] = np.concatenate(
+                [[0]] + [r.arrays[f"{leg}_offsets"][1:] + base for r, base in zip(recordings, bases)]
+            ).astype(np.int64)
+        return Recording([q for r in recordings for q in r.queries], arrays)
+
+    @staticmethod
+    def load(path: str | Path) -> "Recording":
+        path = Path(path)
+        queries = json.loads((path / "queries.json").read_text(encoding="utf-8"))
+        arrays = {
+            f"{leg}_{part}": np.load(path / f"{leg}_{part}.npy", mmap_mode="r")
+            for leg in LEGS for part in ("aids", "scores", "offsets")
+        }
+        return Recording(queries, arrays)
+
+    def leg(self, leg: str, i: int) -> list[dict]:
+        start, end = self.arrays[f"{leg}_offsets"][i:i + 2]
+        aids = self.arrays[f"{leg}_aids"][start:end].tolist()
+        scores = self.arrays[f"{leg}_scores"][start:end].tolist()
+        return [{"aid": aid, "score": score} for aid, score in zip(aids, scores)]
+
+    def rerank_scores(self, i: int) -> dict[int, float]:
+        return {item["aid"]: item["score"] for item in self.leg("rerank", i)}
+
+
+def record(
+    searcher: HybridSearcher, queries: list[dict], path: str | Path, depth: int = 30, batch_size: int = 64
+) -> Recording:
+    """Run both legs `depth` deep, rerank every candidate once, and save the
+    recording to `path`.
+
+    Rerank scores are per document, so any later cut of these candidates can
+    be reranked by sorting the recorded scores. Each batch is checkpointed
+    under `path/parts` as it finishes, and a rerun skips the batches already
+    there. A failed leg or rerank call raises instead of recording a partial
+    candidate set. The searcher's own depths are restored afterwards.
+    """
+    path = Path(path)
+    parts_path = path / "parts"
+    saved = searcher.qdrant_limit, searcher.elastic_size
+    searcher.qdrant_limit = searcher.elastic_size = depth
+
+    def rerank_all(question: str, candidates: list[dict]) -> list[tuple[int, float]]:
+        ranked = searcher.rank(question, candidates, top_n=len(candidates))
+        return [(item["aid"], item["relevance_score"]) for item in ranked]
+
+    parts = []
+    try:
+        for start in range(0, len(queries), batch_size):
+            batch = [{"qid": q["qid"], "question": q["question"]} for q in queries[start:start + batch_size]]
+            part_path = parts_path / f"{start:08d}"
+            parts.append(part_path)
+            if (part_path / "queries.json").exists() and Recording.load(part_path).queries == batch:
+                continue
+            questions = [q["question"] for q in batch]
+            dense, lexical, failed = searcher.candidates(questions)
+            if failed:
+                raise RuntimeError(f"a retrieval leg failed for questions {start}-{start + len(batch) - 1}")
+            futures = [
+                searcher.executor.submit(rerank_all, question, merge_by_aid(d, l))
+                for question, d, l in zip(questions, dense, lexical)
+            ]
+            try:
+                rows = [
+                    {
+                        "dense": [(item["aid"], item["score"]) for item in d],
+                        "lexical": [(item["aid"], item["score"]) for item in l],
+                        "rerank": future.result(),
+                    }
+                    for d, l, future in zip(dense, lexical, futures)
+                ]
+            except Exception:
+                for future in futures:
+                    future.cancel()
+                raise
+            Recording.build(batch, rows).save(part_path)
+            print(f"[Record] {start + len(batch)}/{len(queries)} questions")
+    finally:
+        searcher.qdrant_limit, searcher.elastic_size = saved
+
+    recording = Recording.concat([Recording.load(part) for part in parts])
+    recording.save(path)
+    shutil.rmtree(parts_path)
+    return recording
+
+
+def replay_question(
+    dense: list[dict],
+    lexical: list[dict],
+    scores: dict[int, float],
+    qdrant_limit: int = 3,
+    elastic_size: int = 10,
+    top_n: int = 3,
+    fusion: Fusion | None = None,
+    gate: RerankGate | None = None,
+) -> list[int]:
+    """Mirror `HybridSearcher.finish` with recorded hits and rerank scores; returns ranked aids."""
+    dense = dense[:qdrant_limit]
+    lexical = lexical[:elastic_size]
+    candidates = fusion.fuse(dense, lexical) if fusion is not None else merge_by_aid(dense, lexical)
+    if gate is not None and candidates:
+        decision = gate.decide(dense, lexical)
+        if decision == "skip":
+            return [item["aid"] for item in candidates[:top_n]]
+        if decision == "shrink":
+            candidates = candidates[:gate.shrink_to]
+    ranked = sorted(
+        (item["aid"] for item in candidates if item["aid"] in scores), key=lambda aid: -scores[aid]
+    )
+    return ranked[:top_n]
+
+
+def replay_kwargs(config: dict) -> dict:
+    """`replay_question` arguments from a config of `HybridSearcher` knobs:
+    qdrant_limit, elastic_size, top_n, and optional `fusion` / `gate` kwargs dicts."""
+    kwargs = {k: config[k] for k in ("qdrant_limit", "elastic_size", "top_n") if k in config}
+    if config.get("fusion"):
+        kwargs["fusion"] = Fusion(**config["fusion"])
+    if config.get("gate"):
+        if not config.get("fusion"):
+            raise ValueError("a rerank gate needs fusion: it cuts the candidates in fused order")
+        kwargs["gate"] = RerankGate(**config["gate"])
+    return kwargs
+
+
+_worker: dict = {}
+
+
+def _init_worker(recording_path: str, data_path: str) -> None:
+    recording = Recording.load(recording_path)
+    # Decode every question once per process; configs only re-run the cheap part
+    _worker["questions"] = [
+        (q["qid"], recording.leg("dense", i), recording.leg("lexical", i), recording.rerank_scores(i))
+        for i, q in enumerate(recording.queries)
+    ]
+    _worker["data_path"] = data_path
+
+
+def _score(config: dict) -> dict:
+    kwargs = replay_kwargs(config)
+    results = [
+        {"qid": qid, "relevant_laws": replay_question(dense, lexical, scores, **kwargs)}
+        for qid, dense, lexical, scores in _worker["questions"]
+    ]
+    fd, results_path = tempfile.mkstemp(suffix=".json")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(results, f)
+        return {"config": config} | calculate_metrics(_worker["data_path"], results_path)
+    finally:
+        os.remove(results_path)
+
+
+def grid(**axes: list) -> list[dict]:
+    """Cartesian product of config axes, e.g. grid(top_n=[2, 3], fusion=[None, {...}])."""
+    keys = list(axes)
+    return [dict(zip(keys, values)) for values in itertools.product(*axes.values())]
+
+
+def sweep(recording_path: str | Path, data_path: str | Path, configs: list[dict], workers: int | None = None) -> list[dict]:
+    """Replay and score every config across `workers` processes; best F2 first."""
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(str(recording_path), str(data_path))
+    ) as pool:
+        scored = list(pool.map(_score, configs, chunksize=max(1, len(configs) // (4 * (workers or os.cpu_count() or 1)))))
+    return sorted(scored, key=lambda row: -row["f2"])
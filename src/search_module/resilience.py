@@ -0,0 +1,242 @@
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextvars import copy_context
+from typing import Callable
+
+import elastic_transport
+import requests
+from qdrant_client.http.exceptions import ResponseHandlingException
+
+from .metrics import REGISTRY
+
+# Transport-level failures worth another attempt; API errors are judged by status code
+TRANSIENT_ERRORS = (
+    OSError,
+    requests.RequestException,
+    elastic_transport.TransportError,
+    ResponseHandlingException,
+)
+
+
+class CircuitOpenError(Exception):
+    """The dependency's circuit breaker is open; the call was not attempted."""
+
+
+class DeadlineExceeded(TimeoutError):
+    """No attempt finished within the endpoint's deadline."""
+
+
+def is_retryable(error: BaseException) -> bool:
+    status = getattr(error, "status_code", None)
+    if isinstance(status, int):
+        return status == 429 or status >= 500
+    return isinstance(error, TRANSIENT_ERRORS)
+
+
+class LatencyWindow:
+    """Recent successful call latencies; `quantile` is recomputed every `every` samples."""
+
+    def __init__(self, size: int = 512, every: int = 16) -> None:
+        self.samples: deque[float] = deque(maxlen=size)
+        self.every = every
+        self._added = 0
+        self._cache: dict[float, float] = {}
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float) -> None:
+        with self._lock:
+            self.samples.append(seconds)
+            self._added += 1
+            if self._added % self.every == 0:
+                self._cache.clear()
+
+    def quantile(self, q: float) -> float | None:
+        with self._lock:
+            if len(self.samples) < self.every:
+                return None
+            if q not in self._cache:
+                ordered = sorted(self.samples)
+                self._cache[q] = ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+            return self._cache[q]
+
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive failures. After `reset_after`
+    seconds one trial call is let through (half-open); its outcome closes or
+    re-opens the circuit."""
+
+    def __init__(self, failure_threshold: int = 5, reset_after: float = 30.0) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if time.monotonic() - self.opened_at >= self.reset_after else "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.reset_after and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self._trial or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._trial = False
+
+
+class Policy:
+    """Deadline, retries, hedging and circuit breaking for calls to one dependency.
+
+    A call gets `deadline` seconds in total. Each attempt that is still
+    running after the observed `hedge_quantile` latency gets one duplicate,
+    and the first result wins. Only use this for idempotent calls. Retryable
+    failures (429/5xx, transport errors) are retried with full-jitter
+    backoff while time remains. Only calls that finally fail on a
+    retryable error or the deadline count against the circuit breaker; a
+    non-retryable error (e.g. 400/413) is a reply, so it does not.
+
+    Attempts run on the policy's own thread pool. An abandoned attempt (a
+    hedge loser, or one past its deadline) finishes in the background,
+    bounded by the client's own timeout.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        deadline: float = 5.0,
+        retries: int = 2,
+        backoff: float = 0.1,
+        hedge_quantile: float | None = 0.95,
+        breaker: CircuitBreaker | None = None,
+        max_workers: int = 32,
+    ) -> None:
+        self.name = name
+        self.deadline = deadline
+        self.retries = retries
+        self.backoff = backoff
+        self.hedge_quantile = hedge_quantile
+        self.breaker = breaker or CircuitBreaker()
+        self.latency = LatencyWindow()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"policy-{name}")
+        self.counts = {"calls": 0, "hedged": 0, "retried": 0, "deadline": 0, "rejected": 0, "failed": 0}
+        self._lock = threading.Lock()
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self.counts[key] += 1
+        REGISTRY.inc(f"search_resilience_{key}_total", stage=self.name)
+
+    def _attempt(self, fn: Callable, args, kwargs, until: float):
+        """One attempt, hedged once it outlives the observed tail latency."""
+        start = time.monotonic()
+        # Attempts run in copied contexts so their spans land in the caller's trace
+        futures: list[Future] = [self.executor.submit(copy_context().run, fn, *args, **kwargs)]
+        hedge_after = self.latency.quantile(self.hedge_quantile) if self.hedge_quantile else None
+        if hedge_after is not None and start + hedge_after < until:
+            done, _ = wait(futures, timeout=hedge_after)
+            if not done:
+                self._count("hedged")
+                futures.append(self.executor.submit(copy_context().run, fn, *args, **kwargs))
+        error = None
+        while futures:
+            done, pending = wait(futures, timeout=max(0.0, until - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                raise DeadlineExceeded(f"{self.name}: no response within {self.deadline:.2f}s")
+            for future in done:
+                if future.exception() is None:
+                    self.latency.add(time.monotonic() - start)
+                    return future.result()
+                error = future.exception()
+            futures = list(pending)
+        raise error
+
+    def call(self, fn: Callable, *args, **kwargs):
+        if not self.breaker.allow():
+            self._count("rejected")
+            raise CircuitOpenError(f"{self.name}: circuit open")
+        self._count("calls")
+        until = time.monotonic() + self.deadline
+        attempt = 0
+        while True:
+            try:
+                result = self._attempt(fn, args, kwargs, until)
+            except DeadlineExceeded:
+                self._count("deadline")
+                self._count("failed")
+                self.breaker.failure()
+                raise
+            except Exception as e:
+                if not is_retryable(e):
+                    # The dependency answered (e.g. 400/413): a bad request, not an outage
+                    self._count("failed")
+                    self.breaker.success()
+                    raise
+                delay = random.uniform(0, self.backoff * 2**attempt)
+                if attempt >= self.retries or time.monotonic() + delay >= until:
+                    self._count("failed")
+                    self.breaker.failure()
+                    raise
+                self._count("retried")
+                attempt += 1
+                time.sleep(delay)
+                continue
+            self.breaker.success()
+            return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = dict(self.counts)
+        p95 = self.latency.quantile(0.95)
+        return counts | {"state": self.breaker.state, "p95_ms": p95 * 1000 if p95 is not None else None}
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=False)
+
+
+# Per-dependency defaults for the search path, in seconds
+DEFAULT_DEADLINES = {"embed": 2.0, "qdrant": 1.0, "elastic": 1.0, "rerank": 3.0}
+
+
+class Resilience:
+    """One `Policy` per search dependency (embed, qdrant, elastic, rerank).
+
+    `deadlines` overrides `DEFAULT_DEADLINES` per stage; the other keyword
+    arguments go to every `Policy`.
+    """
+
+    def __init__(self, deadlines: dict[str, float] | None = None, **policy_kwargs) -> None:
+        deadlines = DEFAULT_DEADLINES | (deadlines or {})
+        self.policies = {
+            stage: Policy(stage, deadline=deadline, **policy_kwargs) for stage, deadline in deadlines.items()
+        }
+
+    def call(self, stage: str, fn: Callable, *args, **kwargs):
+        return self.policies[stage].call(fn, *args, **kwargs)
+
+    def stats(self) -> dict:
+        return {stage: policy.stats() for stage, policy in self.policies.items()}
+
+    def close(self) -> None:
+        for policy in self.policies.values():
+            policy.close()
@@ -0,0 +1,351 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar, copy_context
+
+from .cache import ResultCache
+from .db.bm25 import LocalBM25
+from .db.elastic import DEFAULT_SOURCE_FIELDS, Elastic
+from .db.local_vector import LocalVector
+from .db.qdrant import Qdrant
+from .fusion import Fusion, RerankGate
+from .hits import apply_rerank, merge_by_aid, scope_kwargs, to_result_item
+from .jina_client import Jina
+from .metrics import REGISTRY
+from .resilience import Resilience
+from .text_store import ArticleTextStore
+
+# Questions whose results were degraded by a failed call in the current batch (None: all of them)
+_failures: ContextVar[list | None] = ContextVar("search_failures", default=None)
+
+
+def _failed(question: str | None = None) -> None:
+    failures = _failures.get()
+    if failures is not None:
+        failures.append(question)
+
+
+class HybridSearcher:
+    """Dense (Jina + Qdrant) and lexical (ES) retrieval followed by a Jina rerank.
+
+    Clients are created once and reused for every call, so one instance can
+    be kept warm inside a long-running process. Pass your own `elastic`,
+    `qdrant` or `jina` to share them or to configure pooling and caching;
+    `qdrant` may also be a `LocalVector` and `elastic` a `LocalBM25` to run
+    fully offline.
+
+    Without `fusion`, the candidates are the two legs deduplicated by aid.
+    With it, they are the fused ranking, each leg cut to its own depth. An
+    optional `gate` skips or shrinks the rerank call when the legs already
+    agree; `gate.stats()` reports how often that happens. A gate cuts the
+    candidate list, so it needs `fusion` to rank it first. Both are off
+    by default.
+
+    With a `text_store`, both legs return ids only and the article text is
+    read locally for the candidates that actually go to rerank.
+    `qdrant_params` is passed through to `qdrant.search_batch`, e.g.
+    `{"oversampling": 2.0, "rescore": True}` for a quantized collection.
+
+    `search_batch` and `search` take `law_ids` / `doc_ids` to restrict both
+    legs to those laws / documents; the filters run on indexed fields in
+    Qdrant and ES, so a scoped search costs less than an unscoped one.
+    `LocalVector` and `LocalBM25` apply the same filters to their stored payloads.
+
+    Stage timings go to `metrics.REGISTRY`; with a trace file open there,
+    each batch and each question in it is written as a JSONL trace.
+
+    With `resilience`, every embed, Qdrant, ES and rerank call gets a
+    deadline, retries and hedging. An open circuit fails fast, so the batch
+    degrades to the remaining leg. When rerank fails, the fused order is
+    returned instead.
+
+    With a `result_cache`, whole results are reused for questions that
+    normalize to the same text under the same settings and scope. The
+    corpus version (ES index `_meta`, bumped by `Elastic` writes and
+    `ingest` once a write is searchable in both stores) is part of the key and is re-read at most every `version_refresh` seconds.
+    Results degraded by a failed call are not cached. While the version is
+    unknown (never read, never bumped, or a backend without one such as
+    `LocalBM25`) the cache is bypassed, since no write would invalidate it.
+    """
+
+    def __init__(
+        self,
+        db_name: str = "legal_corpus",
+        elastic: Elastic | LocalBM25 | None = None,
+        qdrant: Qdrant | LocalVector | None = None,
+        jina: Jina | None = None,
+        qdrant_limit: int = 3,
+        elastic_size: int = 10,
+        top_n: int = 3,
+        embed_batch_size: int = 64,
+        rerank_workers: int = 8,
+        fusion: Fusion | None = None,
+        gate: RerankGate | None = None,
+        text_store: ArticleTextStore | None = None,
+        qdrant_params: dict | None = None,
+        resilience: Resilience | None = None,
+        result_cache: ResultCache | None = None,
+        version_refresh: float = 5.0,
+    ) -> None:
+        if gate is not None and fusion is None:
+            raise ValueError("a rerank gate needs fusion: it cuts the candidates in fused order")
+        self.db_name = db_name
+        self.elastic = elastic or Elastic()
+        self.qdrant = qdrant or Qdrant()
+        self.jina = jina or Jina(pool_size=max(16, rerank_workers))
+        self.qdrant_limit = qdrant_limit
+        self.elastic_size = elastic_size
+        self.top_n = top_n
+        self.embed_batch_size = embed_batch_size
+        self.fusion = fusion
+        self.gate = gate
+        self.text_store = text_store
+        self.qdrant_params = qdrant_params or {}
+        self.resilience = resilience
+        self.result_cache = result_cache
+        self.version_refresh = version_refresh
+        self._version: str | None = None
+        self._version_read_at = float("-inf")
+        self.executor = ThreadPoolExecutor(max_workers=rerank_workers)
+
+    def close(self) -> None:
+        self.executor.shutdown()
+        self.jina.close()
+        if self.resilience is not None:
+            self.resilience.close()
+        if self.result_cache is not None:
+            self.result_cache.close()
+
+    def _call(self, stage: str, fn, *args, **kwargs):
+        if self.resilience is None:
+            return fn(*args, **kwargs)
+        return self.resilience.call(stage, fn, *args, **kwargs)
+
+    def dense(self, questions: list[str], scope: dict | None = None) -> list[list[dict]]:
+        """Embed all questions and run one Qdrant batch query; one hit list per question.
+
+        `scope` is the filter kwargs from `hits.scope_kwargs`.
+        """
+        try:
+            with REGISTRY.timer("embed"):
+                vectors = self._call("embed", self.jina.embed_by_batch, questions, batch_size=self.embed_batch_size)
+            if len(vectors) != len(questions):
+                raise ValueError(f"got {len(vectors)} embeddings for {len(questions)} questions")
+            with REGISTRY.timer("dense"):
+                hits = self._call(
+                    "qdrant",
+                    self.qdrant.search_batch,
+                    self.db_name,
+                    vectors,
+                    limit=self.qdrant_limit,
+                    fields=DEFAULT_SOURCE_FIELDS if self.text_store is not None else None,
+                    **self.qdrant_params,
+                    **(scope or {}),
+                )
+        except Exception as e:
+            _failed()
+            print(f"[Qdrant Error] Batch of {len(questions)}: {e}")
+            hits = [[] for _ in questions]
+        return [[to_result_item(hit) for hit in query_hits] for query_hits in hits]
+
+    def lexical(self, questions: list[str], scope: dict | None = None) -> list[list[dict]]:
+        """One `_msearch` for all questions; one hit list per question."""
+        fields = DEFAULT_SOURCE_FIELDS
+        if self.text_store is None:
+            # The reranker still needs the article text
+            fields += ("content_Article",)
+        try:
+            with REGISTRY.timer("lexical"):
+                hits = self._call(
+                    "elastic",
+                    self.elastic.search_batch,
+                    self.db_name,
+                    questions,
+                    size=self.elastic_size,
+                    fields=fields,
+                    **(scope or {}),
+                )
+        except Exception as e:
+            _failed()
+            print(f"[Elastic Error] Batch of {len(questions)}: {e}")
+            hits = [[] for _ in questions]
+        return [[to_result_item(hit) for hit in query_hits] for query_hits in hits]
+
+    def candidates(
+        self, questions: list[str], scope: dict | None = None
+    ) -> tuple[list[list[dict]], list[list[dict]], set[int]]:
+        """Run both legs for a batch concurrently; returns (dense, lexical, failed).
+
+        `failed` holds the indices of the questions whose legs are incomplete
+        because a call failed; a leg is one call for the whole batch, so that
+        is either none or all of them.
+        """
+        degraded = []
+        token = _failures.set(degraded)
+        try:
+            # Copied contexts carry the current trace into the worker threads
+            lexical_future = self.executor.submit(copy_context().run, self.lexical, questions, scope)
+            dense = self.dense(questions, scope)
+            lexical = lexical_future.result()
+        finally:
+            _failures.reset(token)
+        return dense, lexical, set(range(len(questions))) if degraded else set()
+
+    def fuse(self, dense: list[dict], lexical: list[dict]) -> list[dict]:
+        """One question's candidates from its two legs."""
+        if self.fusion is None:
+            return merge_by_aid(dense, lexical)
+        return self.fusion.fuse(dense, lexical)
+
+    def articles(self, candidates: list[dict]) -> list[str]:
+        """Candidate texts for rerank. Aids missing from the text store (e.g.
+        added since it was built) are fetched from ES; raises if any is still missing."""
+        if self.text_store is None:
+            return [item["content_Article"] for item in candidates]
+        texts = [self.text_store.get(item["aid"]) for item in candidates]
+        missing = [item["aid"] for item, text in zip(candidates, texts) if text is None]
+        if missing:
+            fetched = self.elastic.get_texts(self.db_name, missing) if hasattr(self.elastic, "get_texts") else {}
+            texts = [fetched.get(item["aid"]) if text is None else text for item, text in zip(candidates, texts)]
+            if None in texts:
+                raise KeyError(f"no article text for aids {[a for a in missing if a not in fetched]}")
+        return texts
+
+    def rank(self, question: str, candidates: list[dict], top_n: int | None = None) -> list[dict]:
+        """Rerank candidates; returns the best `top_n` (default `self.top_n`)
+        with a relevance_score. Raises if the rerank call fails."""
+        if not candidates:
+            return []
+        articles = self.articles(candidates)
+        with REGISTRY.timer("rerank") as span:
+            span["candidates"] = len(candidates)
+            rerank_results = self._call(
+                "rerank",
+                self.jina.rerank,
+                question,
+                articles,
+                top_n=self.top_n if top_n is None else top_n,
+                doc_ids=[item["aid"] for item in candidates],
+            )
+        return apply_rerank(candidates, rerank_results)
+
+    def rerank(self, question: str, candidates: list[dict]) -> list[dict]:
+        """`rank`, except that if the rerank call fails the first `top_n`
+        candidates are returned as is."""
+        try:
+            return self.rank(question, candidates)
+        except Exception as e:
+            _failed(question)
+            print(f"[Rerank Error] {question[:50]!r}: {e}")
+            return candidates[:self.top_n]
+
+    def search_batch(
+        self, questions: list[str], law_ids=None, doc_ids=None, failures: set[int] | None = None
+    ) -> list[list[dict]]:
+        """Search many questions at once; results keep the input order.
+
+        Embedding, Qdrant and ES each take one round trip for the whole batch,
+        and the per-question rerank calls run concurrently. `law_ids` /
+        `doc_ids` scope every question in the batch. A given `failures` set
+        gets the indices of the questions whose results were degraded by a
+        failed call (a leg, or their rerank).
+        """
+        if not questions:
+            return []
+        scope = scope_kwargs(law_ids, doc_ids)
+        degraded = []
+        token = _failures.set(degraded)
+        try:
+            version = self.corpus_version() if self.result_cache is not None else None
+            if version is None:
+                results = self._search_batch(questions, scope)
+                failed = {i for i, q in enumerate(questions) if None in degraded or q in degraded}
+            else:
+                results, failed = self._cached_search_batch(questions, scope, version, degraded)
+        finally:
+            _failures.reset(token)
+        if failures is not None:
+            failures.update(failed)
+        return results
+
+    def _cached_search_batch(
+        self, questions: list[str], scope: dict, version: str, degraded: list
+    ) -> tuple[list[list[dict]], set[int]]:
+        config = self.cache_config(scope)
+        keys = [ResultCache.key(question, config, version) for question in questions]
+        found = self.result_cache.get_many(keys)
+        hit_count = sum(results is not None for results in found)
+        REGISTRY.inc("search_result_cache_hits_total", hit_count)
+        REGISTRY.inc("search_result_cache_misses_total", len(keys) - hit_count)
+        # Questions that normalize alike are searched once
+        misses = {key: question for key, question, results in zip(keys, questions, found) if results is None}
+        if not misses:
+            return found, set()
+        fresh = dict(zip(misses, self._search_batch(list(misses.values()), scope)))
+        bad = {key for key, question in misses.items() if None in degraded or question in degraded}
+        self.result_cache.put_many([(key, fresh[key]) for key in misses if key not in bad])
+        failed = {i for i, (key, results) in enumerate(zip(keys, found)) if results is None and key in bad}
+        return [results if results is not None else fresh[key] for key, results in zip(keys, found)], failed
+
+    def cache_config(self, scope: dict) -> str:
+        """Canonical string of every setting that changes what `search_batch` returns."""
+        config = {
+            "db_name": self.db_name,
+            "qdrant_limit": self.qdrant_limit,
+            "elastic_size": self.elastic_size,
+            "top_n": self.top_n,
+            "dimensions": getattr(self.jina, "dimensions", None),
+            "text_store": self.text_store is not None,
+            "qdrant_params": self.qdrant_params,
+            "fusion": vars(self.fusion) if self.fusion is not None else None,
+            "gate": [self.gate.agree_depth, self.gate.shrink_to] if self.gate is not None else None,
+        } | scope
+        return json.dumps(config, sort_keys=True, ensure_ascii=False)
+
+    def corpus_version(self) -> str | None:
+        """The indexed corpus version, re-read at most every `version_refresh` seconds.
+
+        Backends without a version (LocalBM25) report None. While ES cannot be
+        reached the last known version is kept.
+        """
+        read = getattr(self.elastic, "corpus_version", None)
+        if read is None:
+            return None
+        now = time.monotonic()
+        if now - self._version_read_at >= self.version_refresh:
+            self._version_read_at = now
+            try:
+                self._version = read(self.db_name)
+            except Exception as e:
+                print(f"[Elastic Error] Corpus version: {e}")
+        return self._version
+
+    def _search_batch(self, questions: list[str], scope: dict) -> list[list[dict]]:
+        if self.text_store is not None:
+            self.text_store.refresh()
+        with REGISTRY.timer("search_batch"), REGISTRY.trace(batch_size=len(questions), **scope):
+            dense, lexical, failed = self.candidates(questions, scope)
+            if failed:
+                _failed()
+            futures = [
+                self.executor.submit(copy_context().run, self.finish, question, d, l)
+                for question, d, l in zip(questions, dense, lexical)
+            ]
+            return [future.result() for future in futures]
+
+    def finish(self, question: str, dense: list[dict], lexical: list[dict]) -> list[dict]:
+        """Fuse one question's legs, then rerank as much as the gate allows."""
+        with REGISTRY.trace(question=question) as trace:
+            candidates = self.fuse(dense, lexical)
+            if self.gate is not None and candidates:
+                decision = self.gate.decide(dense, lexical)
+                if trace is not None:
+                    trace.fields["gate"] = decision
+                if decision == "skip":
+                    return candidates[:self.top_n]
+                if decision == "shrink":
+                    candidates = candidates[:self.gate.shrink_to]
+            return self.rerank(question, candidates)
+
+    def search(self, question: str, law_ids=None, doc_ids=None) -> list[dict]:
+        return self.search_batch([question], law_ids=law_ids, doc_ids=doc_ids)[0]
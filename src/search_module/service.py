@@ -0,0 +1,198 @@
+import argparse
+import json
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .cache import ResultCache
+from .metrics import REGISTRY
+from .resilience import Resilience
+from .searcher import HybridSearcher
+
+
+class MicroBatcher:
+    """Coalesces concurrent `submit` calls into `searcher.search_batch` calls.
+
+    The first pending question opens a batch; it is sent once `max_batch`
+    questions are queued or `max_wait_ms` has passed, whichever is first.
+    Up to `batch_workers` batches run at the same time, so a slow batch does
+    not hold back the next window.
+    """
+
+    def __init__(
+        self,
+        searcher: HybridSearcher,
+        max_batch: int = 32,
+        max_wait_ms: float = 5.0,
+        batch_workers: int = 4,
+    ) -> None:
+        self.searcher = searcher
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.pending: queue.Queue[tuple[str, Future]] = queue.Queue()
+        self.executor = ThreadPoolExecutor(max_workers=batch_workers)
+        self.batches = 0
+        self.batched_queries = 0
+        self._thread = threading.Thread(target=self._collect, daemon=True)
+        self._thread.start()
+
+    def submit(self, question: str) -> Future:
+        future: Future = Future()
+        self.pending.put((question, future))
+        return future
+
+    def _collect(self) -> None:
+        while True:
+            batch = [self.pending.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self.pending.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            self.batches += 1
+            self.batched_queries += len(batch)
+            self.executor.submit(self._run, batch)
+
+    def _run(self, batch: list[tuple[str, Future]]) -> None:
+        try:
+            results = self.searcher.search_batch([question for question, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        if len(results) != len(batch):
+            error = RuntimeError(f"search_batch returned {len(results)} results for {len(batch)} questions")
+            for _, future in batch:
+                future.set_exception(error)
+            return
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+
+def make_handler(batcher: MicroBatcher, request_timeout: float = 30.0) -> type[BaseHTTPRequestHandler]:
+    class SearchHandler(BaseHTTPRequestHandler):
+        def _send(self, status: int, data: bytes, content_type: str) -> None:
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _send_json(self, status: int, body: dict) -> None:
+            self._send(status, json.dumps(body, ensure_ascii=False).encode("utf-8"), "application/json")
+
+        def do_GET(self) -> None:
+            if self.path == "/health":
+                body = {
+                    "status": "ok",
+                    "batches": batcher.batches,
+                    "batched_queries": batcher.batched_queries,
+                }
+                if batcher.searcher.gate is not None:
+                    body["rerank_gate"] = batcher.searcher.gate.stats()
+                if batcher.searcher.resilience is not None:
+                    body["resilience"] = batcher.searcher.resilience.stats()
+                if batcher.searcher.result_cache is not None:
+                    body["result_cache"] = batcher.searcher.result_cache.stats()
+                self._send_json(200, body)
+            elif self.path == "/metrics":
+                self._send(200, REGISTRY.to_prometheus().encode("utf-8"), "text/plain; version=0.0.4")
+            else:
+                self._send_json(404, {"error": "not found"})
+
+        def do_POST(self) -> None:
+            if self.path != "/search":
+                self._send_json(404, {"error": "not found"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                question = json.loads(self.rfile.read(length))["question"]
+            except (ValueError, KeyError, TypeError) as e:
+                self._send_json(400, {"error": f"bad request: {e}"})
+                return
+            try:
+                results = batcher.submit(question).result(timeout=request_timeout)
+            except FutureTimeoutError:
+                self._send_json(504, {"error": f"no result within {request_timeout:.0f}s"})
+                return
+            except Exception as e:
+                self._send_json(500, {"error": str(e)})
+                return
+            self._send_json(200, {
+                "results": [
+                    {k: v for k, v in item.items() if k not in ("content_Article", "score")}
+                    for item in results
+                ]
+            })
+
+        def log_message(self, format, *args) -> None:
+            pass
+
+    return SearchHandler
+
+
+def serve(
+    searcher: HybridSearcher,
+    host: str = "127.0.0.1",
+    port: int = 8000,
+    max_batch: int = 32,
+    max_wait_ms: float = 5.0,
+    request_timeout: float = 30.0,
+) -> None:
+    batcher = MicroBatcher(searcher, max_batch=max_batch, max_wait_ms=max_wait_ms)
+    server = ThreadingHTTPServer((host, port), make_handler(batcher, request_timeout))
+    print(f"Serving hybrid search on http://{host}:{port} (POST /search, GET /health, GET /metrics)")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        searcher.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local HTTP service in front of HybridSearcher")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--db-name", default="legal_corpus")
+    parser.add_argument("--max-batch", type=int, default=32)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    parser.add_argument("--request-timeout", type=float, default=30.0, help="seconds before a request gets a 504")
+    parser.add_argument("--trace-path", help="append one JSONL trace per batch and per question")
+    parser.add_argument(
+        "--resilience", action="store_true", help="deadlines, hedging and circuit breakers on external calls"
+    )
+    parser.add_argument(
+        "--result-cache",
+        nargs="?",
+        const="",
+        help="cache whole results; with a SQLite path the cache is shared between processes",
+    )
+    parser.add_argument("--result-cache-ttl", type=float, default=3600.0)
+    args = parser.parse_args()
+
+    if args.trace_path:
+        REGISTRY.open_trace(args.trace_path)
+
+    serve(
+        HybridSearcher(
+            db_name=args.db_name,
+            resilience=Resilience() if args.resilience else None,
+            result_cache=(
+                ResultCache(args.result_cache or None, ttl=args.result_cache_ttl)
+                if args.result_cache is not None
+                else None
+            ),
+        ),
+        host=args.host,
+        port=args.port,
+        max_batch=args.max_batch,
+        max_wait_ms=args.max_wait_ms,
+        request_timeout=args.request_timeout,
+    )
@@ -0,0 +1,128 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from more_itertools import chunked
+
+from .db.elastic import Elastic
+from .db.qdrant import Qdrant
+from .embedding_store import EmbeddingStore
+from .jina_client import Jina
+from .text_store import ArticleTextStore
+
+
+def content_hash(article: dict) -> str:
+    """Stable hash of a flattened article (every field except the embedding)."""
+    data = {k: v for k, v in article.items() if k != "embedding"}
+    return hashlib.sha256(
+        json.dumps(data, ensure_ascii=False, sort_keys=True).encode("utf-8")
+    ).hexdigest()
+
+
+class Manifest:
+    """aid -> content hash of what is currently indexed, kept as a JSON file."""
+
+    def __init__(self, path: str | Path) -> None:
+        self.path = Path(path)
+        self.hashes: dict[int, str] = {}
+        if self.path.exists():
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+            self.hashes = {int(aid): h for aid, h in data.items()}
+
+    def __len__(self) -> int:
+        return len(self.hashes)
+
+    def save(self) -> None:
+        # Write then rename, so a crash never leaves a half-written manifest
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        tmp_path.write_text(json.dumps({str(k): v for k, v in self.hashes.items()}), encoding="utf-8")
+        os.replace(tmp_path, self.path)
+
+    @classmethod
+    def from_store(cls, path: str | Path, store: EmbeddingStore) -> "Manifest":
+        """Bootstrap a manifest from the metadata of a fully uploaded embedding store."""
+        manifest = cls(path)
+        for metadata, _ in store.iter_batches():
+            for article in metadata:
+                manifest.hashes[article["aid"]] = content_hash(article)
+        return manifest
+
+
+def diff(articles: list[dict], manifest: Manifest) -> tuple[list[dict], list[int]]:
+    """Return (new or changed articles, aids that are indexed but no longer in the corpus)."""
+    current = {article["aid"]: article for article in articles}
+    changed = [
+        article for aid, article in current.items()
+        if manifest.hashes.get(aid) != content_hash(article)
+    ]
+    removed = [aid for aid in manifest.hashes if aid not in current]
+    return changed, removed
+
+
+def sync(
+    articles: list[dict],
+    manifest: Manifest,
+    jina: Jina,
+    qdrant: Qdrant,
+    elastic: Elastic,
+    db_name: str,
+    batch_size: int = 32,
+    store: EmbeddingStore | None = None,
+    text_store_path: str | Path | None = None,
+) -> dict:
+    """Bring both stores in line with `articles`, touching only what changed.
+
+    New/changed articles are re-embedded and upserted into Qdrant and ES (both
+    keyed by aid); removed aids are deleted from both. Both writes return once
+    they are searchable, and the ES write, made last, bumps the corpus version.
+    The manifest is saved after every batch, so an interrupted sync picks up
+    where it stopped.
+
+    The local copies follow in the same pass. A `store` (opened with mode "a")
+    gets the new rows and the removals, so `LocalVector` collections built on
+    it re-normalize on next use. The `ArticleTextStore` at `text_store_path`
+    is rewritten from `articles` first, before Qdrant and ES change, so it is
+    current for the whole run and after an interruption. Aids still indexed
+    but already gone from it are read from ES until they are deleted.
+    Searchers that already have it open pick the new file up through
+    `ArticleTextStore.refresh`.
+    """
+    changed, removed = diff(articles, manifest)
+    print(f"{len(changed)} new or changed, {len(removed)} removed, {len(manifest)} indexed.")
+
+    if text_store_path is not None:
+        # Before any upsert, so a changed aid is never reranked on its old text.
+        # Write then rename, so readers never see a half-written store
+        text_store_path = Path(text_store_path)
+        tmp_path = text_store_path.with_suffix(text_store_path.suffix + ".tmp")
+        # The opened store is dropped at once, releasing its map before the rename (Windows)
+        ArticleTextStore.write(tmp_path, ((a["aid"], a["content_Article"]) for a in articles))
+        os.replace(tmp_path, text_store_path)
+        print(f"Rewrote {text_store_path}")
+
+    for batch in chunked(changed, batch_size):
+        embeddings = jina.embed_by_batch([a["content_Article"] for a in batch], batch_size=batch_size)
+        if len(embeddings) != len(batch):
+            raise ValueError(f"got {len(embeddings)} embeddings for {len(batch)} articles")
+        datapoints = [a | {"embedding": e} for a, e in zip(batch, embeddings)]
+        qdrant.bulk_upload(db_name, datapoints)
+        elastic.bulk_upload(db_name, datapoints)
+        if store is not None:
+            store.append([a["aid"] for a in batch], embeddings, list(batch))
+        for article in batch:
+            manifest.hashes[article["aid"]] = content_hash(article)
+        manifest.save()
+        print(f"Upserted aid {batch[0]['aid']}..{batch[-1]['aid']}")
+
+    for batch in chunked(removed, 1000):
+        qdrant.delete(db_name, batch)
+        elastic.delete(db_name, batch)
+        if store is not None:
+            store.remove(batch)
+        for aid in batch:
+            del manifest.hashes[aid]
+        manifest.save()
+        print(f"Deleted {len(batch)} aids")
+
+    return {"upserted": len(changed), "deleted": len(removed)}
@@ -0,0 +1,96 @@
+import mmap
+from pathlib import Path
+from typing import Iterable
+
+import numpy as np
+
+MAGIC = b"ARTTEXT1"
+
+
+class ArticleTextStore:
+    """Read-only aid -> article text lookup from one memory-mapped file.
+
+    Layout: MAGIC, uint64 count, `count` sorted int64 aids, `count + 1`
+    int64 byte offsets into the UTF-8 blob that follows. A lookup is a
+    binary search over the aids followed by a slice of the map; only the
+    pages of the requested articles are ever read.
+
+    The file is replaced, not edited, when the corpus changes (see
+    `sync.sync`). `refresh` re-opens it when the file on disk is a
+    different one, so a long-running searcher can pick up the new version.
+    """
+
+    def __init__(self, path: str | Path) -> None:
+        self.path = Path(path)
+        self._open()
+
+    def _open(self) -> None:
+        stat = self.path.stat()
+        with self.path.open("rb") as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if data[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{self.path} is not an article text store")
+        count = int(np.frombuffer(data, dtype=np.uint64, count=1, offset=len(MAGIC))[0])
+        start = len(MAGIC) + 8
+        aids = np.frombuffer(data, dtype=np.int64, count=count, offset=start)
+        offsets = np.frombuffer(data, dtype=np.int64, count=count + 1, offset=start + 8 * count)
+        # One tuple, swapped in a single assignment, so concurrent lookups never mix two files
+        self._state = (data, aids, offsets, start + 8 * (2 * count + 1))
+        self._file_id = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+    def refresh(self) -> bool:
+        """Re-open the store if its file was replaced; returns whether it was."""
+        stat = self.path.stat()
+        if (stat.st_ino, stat.st_size, stat.st_mtime_ns) == self._file_id:
+            return False
+        self._open()
+        return True
+
+    @property
+    def aids(self) -> np.ndarray:
+        return self._state[1]
+
+    def __len__(self) -> int:
+        return len(self.aids)
+
+    @staticmethod
+    def write(path: str | Path, articles: Iterable[tuple[int, str]]) -> "ArticleTextStore":
+        """Write (aid, text) pairs to a new store file and open it."""
+        pairs = sorted(articles, key=lambda pair: pair[0])
+        encoded = [text.encode("utf-8") for _, text in pairs]
+        offsets = np.zeros(len(pairs) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(data) for data in encoded])
+        with Path(path).open("wb") as f:
+            f.write(MAGIC)
+            f.write(np.uint64(len(pairs)).tobytes())
+            f.write(np.asarray([aid for aid, _ in pairs], dtype=np.int64).tobytes())
+            f.write(offsets.tobytes())
+            for data in encoded:
+                f.write(data)
+        return ArticleTextStore(path)
+
+    def get_bytes(self, aid: int) -> memoryview | None:
+        """Zero-copy view of the article's UTF-8 bytes."""
+        data, aids, offsets, blob_start = self._state
+        i = int(np.searchsorted(aids, aid))
+        if i == len(aids) or aids[i] != aid:
+            return None
+        return memoryview(data)[blob_start + offsets[i]:blob_start + offsets[i + 1]]
+
+    def get(self, aid: int) -> str | None:
+        data = self.get_bytes(aid)
+        return None if data is None else str(data, "utf-8")
+
+    def get_many(self, aids: list[int]) -> list[str | None]:
+        return [self.get(aid) for aid in aids]
+
+
+if __name__ == "__main__":
+    from .embedding_store import EmbeddingStore
+
+    store = EmbeddingStore(r"d:\Work\VLSP\Dataset\legal_corpus_embedded_combined")
+    text_store = ArticleTextStore.write(
+        r"d:\Work\VLSP\Dataset\legal_corpus_text.bin",
+        ((m["aid"], m["content_Article"]) for metadata, _ in store.iter_batches() for m in metadata),
+    )
+    print(f"Wrote {len(text_store)} articles to {text_store.path}")